@@ -0,0 +1,331 @@
+import argparse
+import hashlib
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import taxas
+from sintetico import generate_rate_sheet
+
+# Escalas padrão do benchmark do pipeline: (planos, colunas de taxa, bandeiras, páginas de ruído)
+SCALES = {
+    'pequeno': {'plans': 10, 'columns': 8, 'brands': 8, 'noise_pages': 2},
+    'medio': {'plans': 100, 'columns': 12, 'brands': 8, 'noise_pages': 6},
+    'grande': {'plans': 400, 'columns': 16, 'brands': 8, 'noise_pages': 20},
+}
+DEFAULT_TOLERANCE = 0.25
+# Módulos que só a extração (pdfplumber/pdfminer) e a interface (tkinter) devem carregar
+HEAVY_MODULES = ['pdfplumber', 'pdfminer', 'tkinter']
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _peak_memory_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss vem em KB no Linux e em bytes no macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _run_pipeline(pdf_path, csv_path, prefilter):
+    # Executado num processo novo por escala, para que o pico de memória seja só desta execução
+    # Os planos vão direto de iter_plans para o CSV, como no convert_file; o tempo gasto dentro
+    # do gerador conta como extração e o resto como gravação do CSV
+    stats = {}
+    timing = {'extract': 0.0, 'plans': 0}
+
+    def timed_plans():
+        plans = taxas.iter_plans(pdf_path, stats=stats, prefilter=prefilter)
+        while True:
+            started = time.perf_counter()
+            try:
+                plan = next(plans)
+            except StopIteration:
+                timing['extract'] += time.perf_counter() - started
+                return
+            timing['extract'] += time.perf_counter() - started
+            timing['plans'] += 1
+            yield plan
+
+    started = time.perf_counter()
+    taxas.write_unified_csv(timed_plans(), csv_path)
+    total = time.perf_counter() - started
+    return {
+        'pages': stats.get('pages', 0),
+        'skipped_pages': stats.get('skipped_pages', 0),
+        'plans': timing['plans'],
+        'extract_seconds': timing['extract'],
+        'csv_seconds': total - timing['extract'],
+        'peak_memory_mb': _peak_memory_mb(),
+    }
+
+
+def bench_pipeline(scales, workdir, repeat=1, prefilter=True, out=print):
+    results = {}
+    for name in scales:
+        params = SCALES[name]
+        pdf_path = os.path.join(workdir, f"bench_{name}.pdf")
+        csv_path = os.path.join(workdir, f"bench_{name}_unificado.csv")
+        generate_rate_sheet(pdf_path, seed=1, **params)
+
+        runs = []
+        for _ in range(repeat):
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                runs.append(executor.submit(_run_pipeline, pdf_path, csv_path, prefilter).result())
+        best = min(runs, key=lambda r: r['extract_seconds'] + r['csv_seconds'])
+        wall = best['extract_seconds'] + best['csv_seconds']
+
+        result = dict(params)
+        result.update(best)
+        result['wall_seconds'] = wall
+        result['pages_per_second'] = best['pages'] / wall if wall else 0.0
+        result['input_sha256'] = file_sha256(pdf_path)
+        result['output_sha256'] = file_sha256(csv_path)
+        results[name] = result
+
+        memory = f"{best['peak_memory_mb']:.0f} MB" if best['peak_memory_mb'] is not None else "n/d"
+        out(f"{name:>8}: {best['pages']:>4} páginas, {best['plans']:>4} planos, {wall:7.2f}s "
+            f"(extração {best['extract_seconds']:.2f}s, CSV {best['csv_seconds']:.3f}s), "
+            f"{result['pages_per_second']:.1f} páginas/s, pico {memory}")
+    return results
+
+
+def _run_python(args, cwd):
+    started = time.perf_counter()
+    subprocess.run([sys.executable] + args, cwd=cwd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - started
+
+
+def _loaded_heavy_modules(taxas_args, cwd):
+    # Módulos pesados já importados depois de taxas.main(taxas_args), ou só do import se None
+    call = f"taxas.main({taxas_args!r}); " if taxas_args is not None else ""
+    code = f"import sys, taxas; {call}print('\\nMODULOS=' + ','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, '-c', code], cwd=cwd, check=True, capture_output=True, text=True)
+    loaded = result.stdout.rsplit('MODULOS=', 1)[-1].strip()
+    return [m for m in loaded.split(',') if m]
+
+
+def bench_startup(workdir, repeat=5, out=print):
+    # Tempo de parede de um processo novo, do início ao fim, nos usos que não extraem páginas:
+    # import, --help, inspeção da configuração e reconversão de um PDF que já está no cache
+    repo_dir = os.path.dirname(os.path.abspath(taxas.__file__))
+    taxas_py = os.path.join(repo_dir, 'taxas.py')
+    pdf_path = generate_rate_sheet(os.path.join(workdir, 'inicio.pdf'), seed=1, **SCALES['pequeno'])
+    config_path = os.path.join(workdir, 'inicio.ini')
+    with open(config_path, 'w', encoding='utf-8') as f:
+        f.write("[REPLACEMENTS]\nplano 1x paytime = Plano 1x\nplano promo* = Promoção\n")
+    cached = [pdf_path, '-o', workdir, '-w', '1', '--config', config_path, '--cache', os.path.join(workdir, 'cache')]
+    # Primeira conversão só para preencher o cache
+    _run_python([taxas_py] + cached, repo_dir)
+
+    scenarios = {
+        'import': (['-c', 'import taxas'], None),
+        'ajuda': ([taxas_py, '--help'], None),
+        'config': ([taxas_py, '--mostrar-config', '--config', config_path], ['--mostrar-config', '--config', config_path]),
+        'cache': ([taxas_py] + cached, cached),
+    }
+    python_seconds = min(_run_python(['-c', 'pass'], repo_dir) for _ in range(repeat))
+    out(f"{'python vazio':>12}: {python_seconds * 1000:7.1f}ms")
+    results = {}
+    for name, (args, taxas_args) in scenarios.items():
+        wall = min(_run_python(args, repo_dir) for _ in range(repeat))
+        heavy = _loaded_heavy_modules(taxas_args, repo_dir) if name != 'ajuda' else []
+        results[name] = {'wall_seconds': wall, 'python_seconds': python_seconds, 'heavy_modules': heavy}
+        loaded = f", carregou {', '.join(heavy)}" if heavy else ""
+        out(f"{name:>12}: {wall * 1000:7.1f}ms ({(wall - python_seconds) * 1000:.1f}ms além do interpretador{loaded})")
+    return results
+
+
+def environment_info():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'extractor_version': taxas.EXTRACTOR_VERSION,
+    }
+
+
+def compare_results(current, baseline, tolerance=DEFAULT_TOLERANCE, out=print):
+    # Regressão: saída diferente para a mesma entrada, ou tempo acima da tolerância
+    regressions = []
+    for name, result in current.items():
+        reference = baseline.get('results', {}).get(name)
+        if reference is None:
+            out(f"{name:>8}: sem referência na baseline")
+            continue
+        if 'output_sha256' in result and reference.get('input_sha256') == result['input_sha256'] \
+                and reference.get('output_sha256') != result['output_sha256']:
+            regressions.append(f"{name}: CSV gerado diferente da baseline")
+        if result.get('heavy_modules'):
+            regressions.append(f"{name}: carregou {', '.join(result['heavy_modules'])} sem extrair páginas")
+        ratio = result['wall_seconds'] / reference['wall_seconds'] if reference['wall_seconds'] else 1.0
+        out(f"{name:>8}: {result['wall_seconds']:.2f}s contra {reference['wall_seconds']:.2f}s na baseline ({ratio:.2f}x)")
+        if ratio > 1 + tolerance:
+            regressions.append(f"{name}: {ratio:.2f}x mais lento que a baseline")
+    return regressions
+
+
+def _legacy_group_lines(words):
+    # Agrupamento anterior: dicionário de listas, reordenado linha a linha
+    lines = {}
+    for word in words:
+        y0 = round(word['top'] / taxas.LINE_BUCKET) * taxas.LINE_BUCKET
+        if y0 not in lines: lines[y0] = []
+        lines[y0].append(word)
+    page_lines = []
+    for y, line_words in sorted(lines.items()):
+        line_words.sort(key=lambda w: w['x0'])
+        page_lines.append([(w['text'], w['x0'], w['x1']) for w in line_words])
+    return page_lines
+
+
+def _legacy_assign(line_words, headers_with_boundaries):
+    # Atribuição anterior: para cada coluna, percorre todas as palavras da linha
+    row_data = {}
+    for header_info in headers_with_boundaries:
+        value_in_column = ""
+        for text, x0, x1 in line_words:
+            word_center = (x0 + x1) / 2
+            if header_info['left'] <= word_center < header_info['right']:
+                value_in_column += text + " "
+        row_data[header_info['text']] = value_in_column.strip() if value_in_column else "-"
+    return row_data
+
+
+def _assign(line_words, accumulator):
+    row_data = {}
+    columns = taxas.assign_columns(line_words, accumulator.column_lefts, accumulator.column_rights)
+    for header_info, column_words in zip(accumulator.headers_with_boundaries, columns):
+        row_data[header_info['text']] = ' '.join(column_words).strip() if column_words else "-"
+    return row_data
+
+
+def synthetic_page_words(columns, rows, seed=0):
+    # Palavras no formato e na ordem de leitura de page.extract_words: uma linha de cabeçalho
+    # e uma linha por bandeira
+    rnd = random.Random(seed)
+    col_width = 40.0
+    words = []
+    for row in range(rows + 1):
+        top = 50.0 + row * 14 + rnd.uniform(-1, 1)
+        words.append({'text': f"Linha{row}", 'top': top, 'x0': 10.0, 'x1': 45.0})
+        for col in range(columns):
+            x0 = 60.0 + col * col_width + rnd.uniform(0, 3)
+            text = f"{col + 2}x" if row == 0 else f"{rnd.randint(0, 5)},{rnd.randint(0, 99):02d}%"
+            words.append({'text': text, 'top': top + rnd.uniform(-0.5, 0.5), 'x0': x0, 'x1': x0 + 22.0})
+    return words, 60.0 + columns * col_width
+
+
+def _best_of(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def bench_line_assignment(column_counts=(8, 32, 128, 512), rows=8, repeat=20, out=print):
+    out(f"{'colunas':>8} {'agrupar antes':>14} {'agrupar agora':>14} {'atribuir antes':>15} {'atribuir agora':>15} {'ganho':>7}")
+    for columns in column_counts:
+        words, page_width = synthetic_page_words(columns, rows)
+        page_lines = taxas.group_lines(words)
+        header_line, data_lines = page_lines[0], page_lines[1:]
+
+        accumulator = taxas.PlanAccumulator()
+        accumulator.set_headers(header_line[1:], page_width)
+        for line_words in data_lines:
+            assert _assign(line_words, accumulator) == _legacy_assign(line_words, accumulator.headers_with_boundaries)
+        assert taxas.group_lines(words) == _legacy_group_lines(words)
+
+        group_old = _best_of(lambda: _legacy_group_lines(words), repeat)
+        group_new = _best_of(lambda: taxas.group_lines(words), repeat)
+        assign_old = _best_of(lambda: [_legacy_assign(l, accumulator.headers_with_boundaries) for l in data_lines], repeat)
+        assign_new = _best_of(lambda: [_assign(l, accumulator) for l in data_lines], repeat)
+        speedup = (group_old + assign_old) / (group_new + assign_new)
+        out(f"{columns:>8} {group_old * 1000:>12.3f}ms {group_new * 1000:>12.3f}ms "
+            f"{assign_old * 1000:>13.3f}ms {assign_new * 1000:>13.3f}ms {speedup:>6.1f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks do conversor de taxas")
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    pipeline = subparsers.add_parser('pipeline', help="Extração + CSV sobre PDFs sintéticos em várias escalas")
+    pipeline.add_argument('--escalas', nargs='+', choices=list(SCALES), default=list(SCALES))
+    pipeline.add_argument('--repeticoes', type=int, default=1, help="Execuções por escala (vale a mais rápida)")
+    pipeline.add_argument('--pasta', help="Onde gerar os PDFs e CSVs (padrão: pasta temporária)")
+    pipeline.add_argument('--sem-pre-filtro', action='store_true')
+    pipeline.add_argument('--salvar', help="Grava os resultados como baseline JSON")
+    pipeline.add_argument('--comparar', help="Compara com uma baseline JSON; sai com código 1 se houver regressão")
+    pipeline.add_argument('--tolerancia', type=float, default=DEFAULT_TOLERANCE, help="Folga de tempo aceita antes de acusar regressão (0.25 = 25%%)")
+
+    gerar = subparsers.add_parser('gerar', help="Só gera um PDF sintético")
+    gerar.add_argument('saida')
+    gerar.add_argument('--planos', type=int, default=10)
+    gerar.add_argument('--colunas', type=int, default=8)
+    gerar.add_argument('--bandeiras', type=int, default=8)
+    gerar.add_argument('--ruido', type=int, default=2, help="Páginas sem tabela antes dos planos")
+    gerar.add_argument('--semente', type=int, default=0)
+
+    inicio = subparsers.add_parser('inicio', help="Tempo de inicialização: import, --help, --mostrar-config e reconversão pelo cache")
+    inicio.add_argument('--repeticoes', type=int, default=5, help="Execuções por cenário (vale a mais rápida)")
+    inicio.add_argument('--pasta', help="Onde gerar o PDF, o cache e os CSVs (padrão: pasta temporária)")
+    inicio.add_argument('--salvar', help="Grava os resultados como baseline JSON")
+    inicio.add_argument('--comparar', help="Compara com uma baseline JSON; sai com código 1 se houver regressão")
+    inicio.add_argument('--tolerancia', type=float, default=DEFAULT_TOLERANCE, help="Folga de tempo aceita antes de acusar regressão (0.25 = 25%%)")
+
+    colunas = subparsers.add_parser('colunas', help="Micro-benchmark do agrupamento de linhas e atribuição de colunas")
+    colunas.add_argument('--colunas', type=int, nargs='+', default=[8, 32, 128, 512], help="Larguras de tabela a medir")
+    colunas.add_argument('--repeticoes', type=int, default=20)
+
+    args = parser.parse_args(argv)
+
+    if args.comando == 'gerar':
+        generate_rate_sheet(args.saida, args.planos, args.colunas, args.bandeiras, args.ruido, args.semente)
+        return 0
+
+    if args.comando == 'colunas':
+        bench_line_assignment(args.colunas, repeat=args.repeticoes)
+        return 0
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        workdir = args.pasta or tmpdir
+        os.makedirs(workdir, exist_ok=True)
+        if args.comando == 'inicio':
+            results = bench_startup(workdir, args.repeticoes)
+        else:
+            results = bench_pipeline(args.escalas, workdir, args.repeticoes, not args.sem_pre_filtro)
+
+    if args.salvar:
+        with open(args.salvar, 'w', encoding='utf-8') as f:
+            json.dump({'environment': environment_info(), 'results': results}, f, indent=2, ensure_ascii=False)
+        print(f"Baseline salva em {args.salvar}")
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline, args.tolerancia)
+        for regression in regressions:
+            print(f"REGRESSÃO {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
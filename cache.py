@@ -0,0 +1,142 @@
+import hashlib
+import json
+import logging
+import os
+import zlib
+
+from entrada import PdfSource
+from tabela import PlanTable
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = '.cache_taxas'
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+CACHE_SUFFIX = '.plans.z'
+
+
+def file_digest(pdf_path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(pdf_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def encode_plan(plan_name, table):
+    # Linhas viram listas na ordem dos cabeçalhos: [bandeira, valor1, valor2, ...]
+    rows = [[brand] + table.row(r) for r, brand in enumerate(table.brands)]
+    return json.dumps([plan_name, table.headers, rows], ensure_ascii=False, separators=(',', ':'))
+
+
+def decode_plan(line):
+    plan_name, headers, rows = json.loads(line)
+    table = PlanTable(headers)
+    for row in rows:
+        table.add_row(row[0], row[1:])
+    return plan_name, table
+
+
+class ExtractionCache:
+    # Cache em disco do resultado de extract_data, endereçado pelo conteúdo do PDF e pelos
+    # parâmetros do extrator. Cada entrada é um JSON por linha (um plano por linha, e uma linha
+    # final com o total de páginas) comprimido com zlib, gravado e lido em fluxo.
+    # A remoção é por tamanho total, descartando primeiro as entradas usadas há mais tempo (mtime).
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, pdf_path, params):
+        params_text = json.dumps(params, sort_keys=True, ensure_ascii=False)
+        params_digest = hashlib.sha256(params_text.encode('utf-8')).hexdigest()[:16]
+        digest = pdf_path.digest() if isinstance(pdf_path, PdfSource) else file_digest(pdf_path)
+        return f"{digest}-{params_digest}"
+
+    def entry_path(self, key):
+        return os.path.join(self.directory, key + CACHE_SUFFIX)
+
+    def iter_plans(self, pdf_path, params, extract, stats=None):
+        # extract(stats) deve gerar (nome, dados) como taxas.iter_plans
+        path = self.entry_path(self.key(pdf_path, params))
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            self.misses += 1
+            yield from self._store(path, extract, stats)
+            return
+
+        self.hits += 1
+        with f:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            for line in self._read_lines(f):
+                if line.startswith('{'):
+                    if stats is not None:
+                        stats.update(json.loads(line))
+                else:
+                    yield decode_plan(line)
+
+    def _read_lines(self, f, chunk_size=256 * 1024):
+        decompressor = zlib.decompressobj()
+        pending = b''
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            pending += decompressor.decompress(chunk)
+            *lines, pending = pending.split(b'\n')
+            for line in lines:
+                yield line.decode('utf-8')
+        pending += decompressor.flush()
+        if pending:
+            yield pending.decode('utf-8')
+
+    def _store(self, path, extract, stats):
+        if stats is None:
+            stats = {}
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        compressor = zlib.compressobj(6)
+        completed = False
+        try:
+            with open(tmp_path, 'wb') as f:
+                for plan_name, data in extract(stats):
+                    f.write(compressor.compress((encode_plan(plan_name, data) + '\n').encode('utf-8')))
+                    yield plan_name, data
+                f.write(compressor.compress(json.dumps({'pages': stats.get('pages', 0)}).encode('utf-8')))
+                f.write(compressor.flush())
+            os.replace(tmp_path, path)
+            completed = True
+        finally:
+            if not completed and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith(CACHE_SUFFIX):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+            total += st.st_size
+
+        entries.sort()
+        for mtime, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            total -= size
+            self.evictions += 1
+            logger.info(f"Entrada removida do cache: {name}")
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
@@ -0,0 +1,208 @@
+import configparser
+import logging
+import os
+import pathlib
+from contextlib import contextmanager
+
+from regras import rule_key
+
+logger = logging.getLogger(__name__)
+
+# Regras de substituição e configurações da interface num SQLite ao lado do config.ini
+# (config.ini -> config.db). Cada regra incluída, alterada ou removida é um INSERT/DELETE
+# numa transação, em vez de regravar o arquivo inteiro. Na primeira abertura pela interface,
+# [REPLACEMENTS] e [SETTINGS] do config.ini são importadas; o config.ini continua valendo para
+# as seções editadas à mão ([GRUPO:...], [VIGIA]) e deixa de ser lido para regras e configurações.
+STORE_SUFFIX = '.db'
+SCHEMA_VERSION = 1
+SCHEMA = [
+    # id dá a ordem das regras (curingas e expressões são testados nessa ordem, ver regras.py)
+    "CREATE TABLE IF NOT EXISTS regras (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+    "nome TEXT NOT NULL UNIQUE, substituto TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS configuracoes (chave TEXT PRIMARY KEY, valor TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS meta (chave TEXT PRIMARY KEY, valor TEXT NOT NULL)",
+]
+# Regra que já existe troca o substituto e fica na mesma posição, como num dict
+UPSERT_RULE = ("INSERT INTO regras (nome, substituto) VALUES (?, ?) "
+               "ON CONFLICT (nome) DO UPDATE SET substituto = excluded.substituto")
+
+
+def store_path(config_file):
+    return os.path.splitext(config_file)[0] + STORE_SUFFIX
+
+
+def config_version(config_file):
+    # Muda quando o config.ini ou as regras/configurações do banco mudam (cada transação
+    # gravada atualiza o mtime do banco), para quem recarrega a configuração só quando precisa
+    version = []
+    for path in (config_file, store_path(config_file)):
+        try:
+            version.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            version.append(None)
+    return tuple(version)
+
+
+def _read_ini(config_file):
+    # Sem o optionxform padrão, que põe as chaves em minúsculas: em [REPLACEMENTS], '~\D+' não
+    # é '~\d+'. Regras e configurações passam por _ini_rules/_ini_settings.
+    config = configparser.ConfigParser()
+    config.optionxform = str
+    if os.path.exists(config_file):
+        config.read(config_file, encoding='utf-8')
+    return config
+
+
+def _ini_rules(config):
+    if 'REPLACEMENTS' not in config:
+        return []
+    return [(rule_key(find), replace) for find, replace in config['REPLACEMENTS'].items()]
+
+
+def _ini_settings(config):
+    if 'SETTINGS' not in config:
+        return []
+    return [(key.lower(), value) for key, value in config['SETTINGS'].items()]
+
+
+class ConfigStore:
+    def __init__(self, path, read_only=False):
+        # read_only: para quem só lê as regras (linha de comando, serviço, vigia). A conexão é
+        # aberta com mode=ro, sem criar tabelas nem abrir transação, então não disputa a trava
+        # de escrita com a interface e funciona numa pasta de configuração só de leitura.
+        import sqlite3
+        self.path = path
+        if read_only:
+            self.connection = sqlite3.connect(f"{pathlib.Path(path).resolve().as_uri()}?mode=ro", uri=True,
+                                              isolation_level=None)
+            return
+        self.connection = sqlite3.connect(path, isolation_level=None)
+        try:
+            with self.transaction():
+                for statement in SCHEMA:
+                    self.connection.execute(statement)
+                self.connection.execute("INSERT OR IGNORE INTO meta (chave, valor) VALUES ('versao', ?)", (str(SCHEMA_VERSION),))
+        except Exception:
+            self.connection.close()
+            raise
+
+    @contextmanager
+    def transaction(self):
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield self.connection
+        except BaseException:
+            self.connection.execute('ROLLBACK')
+            raise
+        self.connection.execute('COMMIT')
+
+    @classmethod
+    def for_config(cls, config_file, import_ini=True):
+        # Abre (ou cria) o banco do config_file; import_ini importa o config.ini uma vez só
+        store = cls(store_path(config_file))
+        if import_ini and store.meta('importado_de') is None:
+            store.import_ini(config_file)
+        return store
+
+    def meta(self, key):
+        row = self.connection.execute("SELECT valor FROM meta WHERE chave = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def import_ini(self, config_file):
+        # Numa transação só: ou tudo é importado, ou nada
+        config = _read_ini(config_file)
+        rules = _ini_rules(config)
+        settings = _ini_settings(config)
+        with self.transaction() as connection:
+            connection.executemany(UPSERT_RULE, rules)
+            connection.executemany("INSERT OR REPLACE INTO configuracoes (chave, valor) VALUES (?, ?)", settings)
+            connection.execute("INSERT OR REPLACE INTO meta (chave, valor) VALUES ('importado_de', ?)",
+                               (os.path.abspath(config_file),))
+        if rules or settings:
+            logger.info(f"{len(rules)} regras e {len(settings)} configurações importadas de '{config_file}' para '{self.path}'")
+        return len(rules)
+
+    def rules(self):
+        return dict(self.connection.execute("SELECT nome, substituto FROM regras ORDER BY id"))
+
+    def _filter(self, pattern):
+        if not pattern:
+            return "", ()
+        escaped = pattern.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        like = f"%{escaped}%"
+        return " WHERE nome LIKE ? ESCAPE '\\' OR lower(substituto) LIKE ? ESCAPE '\\'", (like, like)
+
+    def count_rules(self, pattern=''):
+        where, params = self._filter(pattern)
+        return self.connection.execute(f"SELECT count(*) FROM regras{where}", params).fetchone()[0]
+
+    def find_rules(self, pattern='', limit=-1, offset=0):
+        # Uma janela das regras (na ordem delas) cujo nome ou substituto contém pattern
+        where, params = self._filter(pattern)
+        return self.connection.execute(f"SELECT nome, substituto FROM regras{where} ORDER BY id LIMIT ? OFFSET ?",
+                                       params + (limit, offset)).fetchall()
+
+    def add_rule(self, find, replace):
+        self.connection.execute(UPSERT_RULE, (find, replace))
+
+    def remove_rule(self, find):
+        return self.connection.execute("DELETE FROM regras WHERE nome = ?", (find,)).rowcount
+
+    def replace_rule(self, old_find, find, replace):
+        # Troca o nome de uma regra (a nova vai para o fim, como del + inclusão num dict)
+        with self.transaction() as connection:
+            connection.execute("DELETE FROM regras WHERE nome = ?", (old_find,))
+            connection.execute(UPSERT_RULE, (find, replace))
+
+    def settings(self):
+        return dict(self.connection.execute("SELECT chave, valor FROM configuracoes"))
+
+    def save_settings(self, values):
+        # Só as linhas que mudaram são gravadas; sem mudança, nada é escrito no arquivo
+        current = self.settings()
+        changed = [(key, str(value)) for key, value in values.items() if current.get(key) != str(value)]
+        if changed:
+            with self.transaction() as connection:
+                connection.executemany("INSERT OR REPLACE INTO configuracoes (chave, valor) VALUES (?, ?)", changed)
+        return len(changed)
+
+    def close(self):
+        self.connection.close()
+
+
+def _imported_store(config_file):
+    # O banco do config_file aberto só para leitura, se a interface já importou o config.ini para ele
+    if not os.path.exists(store_path(config_file)):
+        return None
+    import sqlite3
+    store = ConfigStore(store_path(config_file), read_only=True)
+    try:
+        if store.meta('importado_de') is not None:
+            return store
+    except sqlite3.DatabaseError as e:
+        # Banco vazio ou de outro programa: vale o config.ini
+        logger.warning(f"'{store.path}' ignorado: {str(e)}")
+    store.close()
+    return None
+
+
+def load_rules(config_file='config.ini'):
+    # Regras em vigor: as do banco, se a interface já o criou, senão as do config.ini
+    store = _imported_store(config_file)
+    if store is None:
+        return dict(_ini_rules(_read_ini(config_file)))
+    try:
+        return store.rules()
+    finally:
+        store.close()
+
+
+def load_settings(config_file='config.ini'):
+    # Mesma precedência de load_rules, para as configurações da interface ([SETTINGS])
+    store = _imported_store(config_file)
+    if store is None:
+        return dict(_ini_settings(_read_ini(config_file)))
+    try:
+        return store.settings()
+    finally:
+        store.close()
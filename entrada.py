@@ -0,0 +1,103 @@
+import hashlib
+import io
+import mmap
+import os
+from contextlib import contextmanager
+
+
+class BufferReader(io.RawIOBase):
+    # Arquivo somente leitura sobre um buffer (bytes, bytearray, memoryview, mmap) sem copiá-lo:
+    # cada read() copia só o trecho pedido
+    def __init__(self, buffer):
+        self.view = memoryview(buffer).cast('B')
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        chunk = self.view[self.position:self.position + len(b)]
+        size = len(chunk)
+        b[:size] = chunk
+        self.position += size
+        return size
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            base = 0
+        elif whence == io.SEEK_CUR:
+            base = self.position
+        else:
+            base = len(self.view)
+        self.position = max(0, base + offset)
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def close(self):
+        # Libera o buffer (um mmap não pode ser fechado enquanto houver memoryview aberta)
+        if not self.closed:
+            self.view.release()
+        super().close()
+
+
+class PdfSource:
+    # Entrada da extração: caminho, bytes, bytearray, memoryview, mmap ou arquivo binário aberto.
+    # Buffers são lidos sem cópia; um arquivo sem seek (stdin, socket) é lido para a memória uma vez.
+    def __init__(self, source, name=None):
+        self.path = None
+        self.buffer = None
+        self.stream = None
+        if isinstance(source, PdfSource):
+            self.path, self.buffer, self.stream = source.path, source.buffer, source.stream
+            name = name or source.name
+        elif isinstance(source, (str, os.PathLike)):
+            self.path = os.fspath(source)
+        elif isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+            self.buffer = source
+        elif hasattr(source, 'read'):
+            if isinstance(source, io.BytesIO):
+                # getvalue() devolve o próprio conteúdo, sem cópia, quando o BytesIO não foi alterado depois
+                self.buffer = source.getvalue()
+            elif getattr(source, 'seekable', lambda: False)() and hasattr(source, 'readinto'):
+                self.stream = source
+            else:
+                self.buffer = source.read()
+        else:
+            raise TypeError(f"Entrada de PDF não suportada: {type(source).__name__}")
+        self.name = name or self.path or getattr(source, 'name', None) or '<memória>'
+
+    def __str__(self):
+        return str(self.name)
+
+    @contextmanager
+    def reader(self):
+        # Caminho ou arquivo posicionado no início, no formato aceito pelo pdfplumber e pelo pdfium.
+        # Cada chamada sobre um buffer ganha um leitor próprio, então duas leituras não se atrapalham
+        if self.path is not None:
+            yield self.path
+        elif self.buffer is not None:
+            with BufferReader(self.buffer) as f:
+                yield f
+        else:
+            self.stream.seek(0)
+            yield self.stream
+
+    def digest(self, chunk_size=1024 * 1024):
+        digest = hashlib.sha256()
+        if self.buffer is not None:
+            digest.update(self.buffer)
+            return digest.hexdigest()
+        f = open(self.path, 'rb') if self.path is not None else self.stream
+        try:
+            f.seek(0)
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+        finally:
+            if self.path is not None:
+                f.close()
+        return digest.hexdigest()
@@ -0,0 +1,268 @@
+import csv
+import os
+import tempfile
+
+from tabela import EMPTY_VALUES, NO_RATE, RATE_SCALE
+
+# Tabela longa: uma linha por célula de taxa, já normalizada para carga em banco/planilha.
+# 'taxa' é o percentual como número (1,99% -> 1.99), vazio quando o texto não é uma taxa.
+LONG_COLUMNS = ['arquivo', 'plano', 'forma_pagamento', 'bandeira', 'taxa_texto', 'taxa']
+LONG_FORMATS = ['csv', 'parquet', 'feather']
+BATCH_SIZE = 50000
+
+SQLITE_TABLE = 'taxas'
+SQLITE_COLUMNS = ("arquivo TEXT NOT NULL, plano TEXT NOT NULL, forma_pagamento TEXT NOT NULL, "
+                  "bandeira TEXT NOT NULL, taxa_texto TEXT NOT NULL, taxa REAL")
+INSERT_ROW = f"INSERT INTO {SQLITE_TABLE} ({', '.join(LONG_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?)"
+SQLITE_INDEXES = {
+    'idx_taxas_arquivo': 'arquivo',
+    'idx_taxas_plano': 'plano',
+    'idx_taxas_bandeira': 'bandeira',
+}
+
+
+def iter_long_rows(source, plan_name, table):
+    # Uma linha por bandeira x forma de pagamento, sem as células vazias ('' ou '-').
+    # Usa as bandeiras como extraídas, sem a unificação de colunas do CSV.
+    width = len(table.headers)
+    values = table.values
+    rates = table.rates
+    columns = list(table.header_index.items())
+    for r, brand in enumerate(table.brands):
+        base = r * width
+        for option, c in columns:
+            text = values[base + c]
+            if text in EMPTY_VALUES:
+                continue
+            rate = rates[base + c]
+            yield source, plan_name, option, brand, text, None if rate == NO_RATE else rate / RATE_SCALE
+
+
+class SqliteExporter:
+    # Todas as conversões podem gravar no mesmo banco; as linhas de um PDF substituem as da
+    # conversão anterior do mesmo arquivo. Enquanto o PDF é extraído, as linhas vão em lotes de
+    # BATCH_SIZE para um banco temporário só deste exportador; close() copia tudo para o banco
+    # de destino numa transação só - assim ele não fica travado durante a extração e vários
+    # processos do lote podem usar o mesmo arquivo, sem que o PDF inteiro fique em memória.
+    def __init__(self, db_path, source):
+        self.path = db_path
+        self.source = source
+        self.pending = []
+        self.staging = None
+        self.staging_path = None
+
+    def add(self, plan_name, table):
+        self.pending.extend(iter_long_rows(self.source, plan_name, table))
+        if len(self.pending) >= BATCH_SIZE:
+            self._flush()
+
+    def _flush(self):
+        import sqlite3
+        if self.staging is None:
+            fd, self.staging_path = tempfile.mkstemp(prefix='taxas_', suffix='.db')
+            os.close(fd)
+            self.staging = sqlite3.connect(self.staging_path, isolation_level=None)
+            # Descartável: sem journal nem fsync
+            self.staging.execute('PRAGMA journal_mode = OFF')
+            self.staging.execute('PRAGMA synchronous = OFF')
+            self.staging.execute(f"CREATE TABLE {SQLITE_TABLE} ({SQLITE_COLUMNS})")
+        self.staging.execute('BEGIN')
+        self.staging.executemany(INSERT_ROW, self.pending)
+        self.staging.execute('COMMIT')
+        self.pending = []
+
+    def close(self):
+        import sqlite3
+        if self.staging is not None:
+            # PDF grande: o resto também vai para o banco temporário, copiado de uma vez abaixo
+            self._flush()
+            self.staging.close()
+        connection = sqlite3.connect(self.path, timeout=120, isolation_level=None)
+        try:
+            # Mais páginas em memória para a carga e a ordenação dos índices
+            connection.execute('PRAGMA cache_size = -262144')
+            connection.execute('PRAGMA temp_store = MEMORY')
+            if self.staging_path is not None:
+                # ATTACH não pode ser feito dentro da transação
+                connection.execute("ATTACH DATABASE ? AS carga", (self.staging_path,))
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute(f"CREATE TABLE IF NOT EXISTS {SQLITE_TABLE} ({SQLITE_COLUMNS})")
+            connection.execute(f"DELETE FROM {SQLITE_TABLE} WHERE arquivo = ?", (self.source,))
+            # Carga inicial: os índices são criados depois das linhas, de uma vez, em vez de
+            # atualizados a cada INSERT
+            if connection.execute(f"SELECT 1 FROM {SQLITE_TABLE} LIMIT 1").fetchone() is None:
+                for index_name in SQLITE_INDEXES:
+                    connection.execute(f"DROP INDEX IF EXISTS {index_name}")
+            if self.staging_path is not None:
+                columns = ', '.join(LONG_COLUMNS)
+                connection.execute(f"INSERT INTO main.{SQLITE_TABLE} ({columns}) SELECT {columns} FROM carga.{SQLITE_TABLE}")
+            else:
+                connection.executemany(INSERT_ROW, self.pending)
+            for index_name, column in SQLITE_INDEXES.items():
+                connection.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {SQLITE_TABLE} ({column})")
+            connection.execute('COMMIT')
+        except Exception:
+            if connection.in_transaction:
+                connection.execute('ROLLBACK')
+            raise
+        finally:
+            connection.close()
+            self._discard()
+        return self.path
+
+    def _discard(self):
+        self.pending = []
+        if self.staging is not None:
+            self.staging.close()
+            self.staging = None
+        if self.staging_path is not None:
+            if os.path.exists(self.staging_path):
+                os.remove(self.staging_path)
+            self.staging_path = None
+
+    def abort(self):
+        self._discard()
+
+
+class LongTableExporter:
+    # <nome>_taxas.csv / .parquet / .feather, gravado em fluxo num arquivo temporário que só
+    # substitui o definitivo em close(). parquet e feather precisam do pacote opcional pyarrow.
+    def __init__(self, path, source, fmt):
+        self.path = path
+        self.source = source
+        self.format = fmt
+        self.tmp_path = f"{path}.{os.getpid()}.tmp"
+        self.pending = []
+        if fmt == 'csv':
+            self.file = open(self.tmp_path, 'w', newline='', encoding='utf-8-sig')
+            self.writer = csv.writer(self.file, delimiter=';')
+            self.writer.writerow(LONG_COLUMNS)
+            return
+
+        try:
+            import pyarrow
+            import pyarrow.ipc
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError(f"A exportação em {fmt} precisa do pacote pyarrow (pip install pyarrow)")
+        self.pyarrow = pyarrow
+        self.schema = pyarrow.schema([(name, pyarrow.string()) for name in LONG_COLUMNS[:-1]] + [('taxa', pyarrow.float64())])
+        if fmt == 'parquet':
+            self.writer = pyarrow.parquet.ParquetWriter(self.tmp_path, self.schema)
+        else:
+            # Feather v2 é o formato de arquivo IPC do Arrow
+            self.sink = pyarrow.OSFile(self.tmp_path, 'wb')
+            self.writer = pyarrow.ipc.new_file(self.sink, self.schema)
+
+    def add(self, plan_name, table):
+        rows = iter_long_rows(self.source, plan_name, table)
+        if self.format == 'csv':
+            # O csv grava None como campo vazio
+            self.writer.writerows(rows)
+            return
+        self.pending.extend(rows)
+        if len(self.pending) >= BATCH_SIZE:
+            self._flush()
+
+    def _flush(self):
+        if not self.pending:
+            return
+        columns = [list(column) for column in zip(*self.pending)]
+        batch = self.pyarrow.RecordBatch.from_arrays(
+            [self.pyarrow.array(column, type=field.type) for column, field in zip(columns, self.schema)],
+            schema=self.schema)
+        if self.format == 'parquet':
+            self.writer.write_table(self.pyarrow.Table.from_batches([batch]))
+        else:
+            self.writer.write_batch(batch)
+        self.pending = []
+
+    def _close_writer(self):
+        self.writer.close()
+        if self.format == 'feather':
+            self.sink.close()
+
+    def close(self):
+        if self.format == 'csv':
+            self.file.close()
+        else:
+            self._flush()
+            self._close_writer()
+        os.replace(self.tmp_path, self.path)
+        return self.path
+
+    def abort(self):
+        try:
+            if self.format == 'csv':
+                self.file.close()
+            else:
+                self._close_writer()
+        finally:
+            if os.path.exists(self.tmp_path):
+                os.remove(self.tmp_path)
+
+
+def long_table_path(pdf_path, output_dir, fmt):
+    base_name = os.path.splitext(os.path.basename(pdf_path))[0]
+    return os.path.join(output_dir, f"{base_name}_taxas.{fmt}")
+
+
+def source_label(pdf_path):
+    # Valor da coluna 'arquivo': o caminho absoluto, para que PDFs de mesmo nome em pastas
+    # diferentes não substituam as linhas um do outro no banco
+    return os.path.abspath(pdf_path)
+
+
+def open_exporters(pdf_path, output_dir, sqlite_path=None, long_format=None):
+    source = source_label(pdf_path)
+    exporters = []
+    try:
+        if sqlite_path:
+            exporters.append(SqliteExporter(sqlite_path, source))
+        if long_format:
+            exporters.append(LongTableExporter(long_table_path(pdf_path, output_dir, long_format), source, long_format))
+    except Exception:
+        abort_exporters(exporters)
+        raise
+    return exporters
+
+
+def export_plans(plans, pdf_path, output_dir, sqlite_path=None, long_format=None):
+    # Para quem já tem todos os planos (ex.: a interface); devolve os arquivos gravados
+    exporters = open_exporters(pdf_path, output_dir, sqlite_path, long_format)
+    try:
+        for plan_name, table in plans:
+            for exporter in exporters:
+                exporter.add(plan_name, table)
+    except Exception:
+        abort_exporters(exporters)
+        raise
+    return close_exporters(exporters)
+
+
+def iter_exported(plans, exporters):
+    # Repassa (nome, tabela) adiante depois de entregar cada plano aos exportadores
+    for plan_name, table in plans:
+        for exporter in exporters:
+            exporter.add(plan_name, table)
+        yield plan_name, table
+
+
+def close_exporters(exporters):
+    # Fecha (publica) cada exportação, em ordem; se uma falha, ela e as seguintes são descartadas
+    closed = []
+    for i, exporter in enumerate(exporters):
+        try:
+            closed.append(exporter.close())
+        except Exception:
+            abort_exporters(exporters[i:])
+            raise
+    return closed
+
+
+def abort_exporters(exporters):
+    for exporter in exporters:
+        try:
+            exporter.abort()
+        except Exception:
+            pass
@@ -0,0 +1,242 @@
+import itertools
+from contextlib import contextmanager
+
+# Fontes de caracteres para o algoritmo de linhas e colunas (ver taxas.iter_plans). Um extrator
+# abre o PDF e, para cada página, devolve a largura e as palavras na ordem de leitura do
+# page.extract_words do pdfplumber, como dicts com 'text', 'x0', 'x1' e 'top'.
+#   pdfplumber - o próprio page.extract_words (referência)
+#   pdfminer   - lê os LTChar direto do layout do pdfminer, sem montar os dicts de objeto do
+#                pdfplumber, e agrupa as palavras com as mesmas regras do WordExtractor dele
+DEFAULT_BACKEND = 'pdfplumber'
+HEADER_TEXT = "PAYTIME"
+
+# Mesma expansão de ligaduras do pdfplumber (expand_ligatures=True)
+LIGATURES = {
+    "ﬀ": "ff",
+    "ﬃ": "ffi",
+    "ﬄ": "ffl",
+    "ﬁ": "fi",
+    "ﬂ": "fl",
+    "ﬆ": "st",
+    "ﬅ": "st",
+}
+
+
+def normalize_header_text(text):
+    return text.upper().replace("Ν", "N")
+
+
+def header_cut(chars, page_top, margin):
+    # chars: (texto, top) na ordem dos caracteres do PDF. Devolve a altura logo acima do
+    # primeiro cabeçalho "PAYTIME", ou None se não há cabeçalho ou o corte não tira nada.
+    text_parts = []
+    tops = []
+    for char_text, top in chars:
+        text = normalize_header_text(char_text)
+        if text.isspace():
+            continue
+        text_parts.append(text)
+        tops.extend([top] * len(text))
+    text = ''.join(text_parts)
+
+    header_tops = []
+    start = text.find(HEADER_TEXT)
+    while start != -1:
+        header_tops.append(min(tops[start:start + len(HEADER_TEXT)]))
+        start = text.find(HEADER_TEXT, start + 1)
+    if not header_tops:
+        return None
+
+    # Corte só na vertical: colunas que passam da margem direita da página continuam valendo
+    cut = min(header_tops) - margin
+    if cut <= page_top:
+        return None
+    return cut
+
+
+class PdfplumberDocument:
+    def __init__(self, pdf, backend):
+        self.pdf = pdf
+        self.backend = backend
+
+    def __len__(self):
+        return len(self.pdf.pages)
+
+    def extract(self, index, crop=False):
+        # (largura, palavras, caracteres descartados pelo recorte)
+        page = self.pdf.pages[index]
+        extract_from = page
+        chars_skipped = 0
+        if crop:
+            cut = header_cut(((c['text'], c['top']) for c in page.chars), page.bbox[1], self.backend.crop_margin)
+            if cut is not None:
+                extract_from = page.filter(lambda obj: obj.get('top', cut) >= cut)
+                chars_skipped = len(page.chars) - len(extract_from.chars)
+        words = extract_from.extract_words(x_tolerance=self.backend.x_tolerance, y_tolerance=self.backend.y_tolerance,
+                                           keep_blank_chars=False)
+        width = extract_from.width
+        page.close()
+        return width, words, chars_skipped
+
+
+class PdfplumberBackend:
+    name = 'pdfplumber'
+
+    def __init__(self, x_tolerance, y_tolerance, crop_margin):
+        self.x_tolerance = x_tolerance
+        self.y_tolerance = y_tolerance
+        self.crop_margin = crop_margin
+
+    @contextmanager
+    def open(self, pdf_file, first=0, last=None):
+        import pdfplumber
+        pages = None if first == 0 and last is None else list(range(first + 1, last + 1))
+        with pdfplumber.open(pdf_file, pages=pages) as pdf:
+            yield PdfplumberDocument(pdf, self)
+
+
+class PdfminerDocument:
+    def __init__(self, pdf_file, backend, first, last):
+        from pdfminer.converter import PDFPageAggregator
+        from pdfminer.layout import LTChar, LTContainer
+        from pdfminer.pdfdocument import PDFDocument
+        from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+        from pdfminer.pdfpage import PDFPage
+        from pdfminer.pdfparser import PDFParser
+        from pdfminer.pdftypes import resolve_all
+        self.aggregator = PDFPageAggregator
+        self.interpreter = PDFPageInterpreter
+        self.char_type = LTChar
+        self.container_type = LTContainer
+        self.resolve_all = resolve_all
+        self.backend = backend
+        self.resources = PDFResourceManager()
+        document = PDFDocument(PDFParser(pdf_file), password='')
+        pages = list(enumerate(PDFPage.create_pages(document)))
+        self.pages = pages[first:last]
+
+    def __len__(self):
+        return len(self.pages)
+
+    def _page_box(self, page):
+        # MediaBox como o pdfplumber a vê: normalizada pela rotação e com a origem no topo
+        rotation = (self.resolve_all(page.attrs.get('Rotate')) or 0) % 360
+        box = self.resolve_all(page.attrs.get('MediaBox'))
+        x0, x1 = sorted((box[0], box[2]))
+        y0, y1 = sorted((box[1], box[3]))
+        if rotation in (90, 270):
+            x0, y0, x1, y1 = y0, x0, y1, x1
+        height = y1 - y0
+        return x0, height - y1, x1, height - y0
+
+    def _iter_chars(self, layout_objects):
+        for obj in layout_objects:
+            if isinstance(obj, self.container_type):
+                yield from self._iter_chars(obj._objs)
+            elif isinstance(obj, self.char_type):
+                yield obj
+
+    def extract(self, index, crop=False):
+        page_number, page = self.pages[index]
+        device = self.aggregator(self.resources, pageno=page_number + 1, laparams=None)
+        self.interpreter(self.resources, device).process_page(page)
+        layout = device.get_result()
+
+        mb_x0, mb_top, mb_x1, mb_bottom = self._page_box(page)
+        height = mb_bottom - mb_top
+        # (texto, x0, x1, top, bottom, upright), com as coordenadas do pdfplumber
+        chars = [(c._text, c.x0 + mb_x0, c.x1 + mb_x0, height - c.y1 + mb_top, height - c.y0 + mb_top, c.upright)
+                 for c in self._iter_chars(layout._objs)]
+
+        chars_skipped = 0
+        if crop:
+            cut = header_cut(((c[0], c[3]) for c in chars), mb_top, self.backend.crop_margin)
+            if cut is not None:
+                total = len(chars)
+                chars = [c for c in chars if c[3] >= cut]
+                chars_skipped = total - len(chars)
+        return mb_x1 - mb_x0, chars_to_words(chars, self.backend.x_tolerance, self.backend.y_tolerance), chars_skipped
+
+
+class PdfminerBackend:
+    name = 'pdfminer'
+
+    def __init__(self, x_tolerance, y_tolerance, crop_margin):
+        self.x_tolerance = x_tolerance
+        self.y_tolerance = y_tolerance
+        self.crop_margin = crop_margin
+
+    @contextmanager
+    def open(self, pdf_file, first=0, last=None):
+        if isinstance(pdf_file, str):
+            with open(pdf_file, 'rb') as f:
+                yield PdfminerDocument(f, self, first, last)
+        else:
+            yield PdfminerDocument(pdf_file, self, first, last)
+
+
+def _cluster_lines(chars, key, tolerance):
+    # cluster_objects do pdfplumber: valores distintos ordenados, encadeados enquanto a
+    # distância para o anterior não passa da tolerância; a ordem original é mantida em cada grupo
+    values = sorted(set(key(c) for c in chars))
+    cluster_of = {}
+    cluster = 0
+    last = None
+    for value in values:
+        if last is not None and value > last + tolerance:
+            cluster += 1
+        cluster_of[value] = cluster
+        last = value
+    ordered = sorted(chars, key=lambda c: cluster_of[key(c)])
+    return [list(group) for _, group in itertools.groupby(ordered, key=lambda c: cluster_of[key(c)])]
+
+
+def chars_to_words(chars, x_tolerance, y_tolerance):
+    # WordExtractor do pdfplumber com keep_blank_chars=False e as direções padrão: linhas de
+    # cima para baixo e caracteres da esquerda para a direita (texto girado: o inverso)
+    words = []
+    for upright, group in itertools.groupby(chars, key=lambda c: c[5]):
+        group = list(group)
+        if upright:
+            lines = _cluster_lines(group, lambda c: c[3], y_tolerance)
+            sort_key = lambda c: c[1]
+        else:
+            lines = _cluster_lines(group, lambda c: c[1], x_tolerance)
+            sort_key = lambda c: (c[3], c[4])
+        for line in lines:
+            line.sort(key=sort_key)
+            current = []
+            for char in line:
+                if char[0].isspace():
+                    if current:
+                        words.append(_merge_word(current))
+                    current = []
+                elif current and _begins_new_word(current[-1], char, upright, x_tolerance, y_tolerance):
+                    words.append(_merge_word(current))
+                    current = [char]
+                else:
+                    current.append(char)
+            if current:
+                words.append(_merge_word(current))
+    return words
+
+
+def _begins_new_word(prev, char, upright, x_tolerance, y_tolerance):
+    if upright:
+        return char[1] < prev[1] or char[1] > prev[2] + x_tolerance or abs(char[3] - prev[3]) > y_tolerance
+    return char[3] < prev[3] or char[3] > prev[4] + y_tolerance or abs(char[1] - prev[1]) > x_tolerance
+
+
+def _merge_word(chars):
+    return {
+        'text': ''.join(LIGATURES.get(c[0], c[0] or '') for c in chars),
+        'x0': min(c[1] for c in chars),
+        'x1': max(c[2] for c in chars),
+        'top': min(c[3] for c in chars),
+    }
+
+
+BACKENDS = {
+    PdfplumberBackend.name: PdfplumberBackend,
+    PdfminerBackend.name: PdfminerBackend,
+}
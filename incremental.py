@@ -0,0 +1,222 @@
+import csv
+import hashlib
+import json
+import logging
+import os
+import zlib
+
+from cache import encode_plan, decode_plan
+from exportar import iter_long_rows
+from tabela import parse_rate, NO_RATE
+
+logger = logging.getLogger(__name__)
+
+# Reconversão incremental: o estado de uma conversão (<nome>_estado.z) guarda a impressão
+# digital e as linhas extraídas de cada página e os planos gravados no CSV. Na conversão
+# seguinte, páginas com a mesma impressão digital não são extraídas de novo, e o
+# <nome>_delta.csv lista o que mudou em relação aos planos anteriores.
+STATE_VERSION = 1
+STATE_SUFFIX = '_estado.z'
+DELTA_SUFFIX = '_delta.csv'
+DELTA_COLUMNS = ['alteracao', 'plano', 'forma_pagamento', 'bandeira', 'taxa_anterior', 'taxa_nova']
+
+# Chaves da página que não mudam o que é extraído dela
+IGNORED_PAGE_KEYS = ('Parent', 'Annots', 'B', 'LastModified', 'StructParents', 'Thumb', 'PieceInfo')
+
+
+def _object_digest(obj, memo, doc_types):
+    # Digest do objeto PDF já resolvido: streams pelo conteúdo decodificado (recomprimir o
+    # arquivo não muda a página), referências memorizadas por objid - fontes e imagens
+    # compartilhadas entre páginas são lidas uma vez só.
+    PDFObjRef, PDFStream, PSLiteral, PSKeyword = doc_types
+    if isinstance(obj, PDFObjRef):
+        digest = memo.get(obj.objid)
+        if digest is None:
+            # Marca antes de descer: referências circulares (ex.: /P, /Parent) não entram em laço
+            memo[obj.objid] = b'ref:%d' % obj.objid
+            digest = memo[obj.objid] = _object_digest(obj.resolve(), memo, doc_types)
+        return digest
+    digest = hashlib.sha256()
+    if isinstance(obj, PDFStream):
+        digest.update(b'stream')
+        for key in sorted(k for k in obj.attrs if k not in ('Length', 'Filter', 'DecodeParms')):
+            digest.update(key.encode('utf-8', 'replace'))
+            digest.update(_object_digest(obj.attrs[key], memo, doc_types))
+        digest.update(obj.get_data())
+    elif isinstance(obj, dict):
+        digest.update(b'dict')
+        for key in sorted(k for k in obj if k not in ('Parent', 'P')):
+            digest.update(str(key).encode('utf-8', 'replace'))
+            digest.update(_object_digest(obj[key], memo, doc_types))
+    elif isinstance(obj, (list, tuple)):
+        digest.update(b'list')
+        for item in obj:
+            digest.update(_object_digest(item, memo, doc_types))
+    elif isinstance(obj, (PSLiteral, PSKeyword)):
+        digest.update(b'name' + repr(obj.name).encode('utf-8', 'replace'))
+    elif isinstance(obj, bytes):
+        digest.update(b'bytes' + obj)
+    else:
+        digest.update(repr(obj).encode('utf-8', 'replace'))
+    return digest.digest()
+
+
+def page_fingerprints(pdf_file):
+    # Uma impressão digital por página: conteúdo, recursos (fontes, XObjects) e caixas/rotação,
+    # herdados da árvore de páginas. Só lê e decodifica os objetos, sem interpretar o layout.
+    from pdfminer.pdfdocument import PDFDocument
+    from pdfminer.pdfpage import PDFPage
+    from pdfminer.pdfparser import PDFParser
+    from pdfminer.pdftypes import PDFObjRef, PDFStream
+    from pdfminer.psparser import PSKeyword, PSLiteral
+    if isinstance(pdf_file, str):
+        with open(pdf_file, 'rb') as f:
+            return page_fingerprints(f)
+    doc_types = (PDFObjRef, PDFStream, PSLiteral, PSKeyword)
+    memo = {}
+    fingerprints = []
+    document = PDFDocument(PDFParser(pdf_file), password='')
+    for page in PDFPage.create_pages(document):
+        attrs = {k: v for k, v in page.attrs.items() if k not in IGNORED_PAGE_KEYS}
+        fingerprints.append(_object_digest(attrs, memo, doc_types).hex())
+    return fingerprints
+
+
+class ConversionState:
+    # pages: {'fp', 'mode', 'width', 'lines', 'skipped_chars'} por página, na ordem do PDF.
+    #   mode 'full' - linhas da página inteira, reaproveitáveis em qualquer ponto do PDF
+    #   mode 'crop' - só a partir do primeiro cabeçalho; 'skip' - página sem tabela, sem linhas.
+    #   Estas duas só valem quando nenhum plano está esperando linhas da página.
+    # plans: [(nome, PlanTable)] como gravados no CSV (depois das substituições)
+    def __init__(self, params=None, pages=None, plans=None):
+        self.params = params
+        self.pages = pages or []
+        self.plans = plans or []
+
+    def pages_by_fingerprint(self):
+        return {page['fp']: page for page in self.pages}
+
+    @classmethod
+    def load(cls, path):
+        # None se não há estado (primeira conversão) ou se ele não pode ser lido
+        try:
+            with open(path, 'rb') as f:
+                text = zlib.decompress(f.read()).decode('utf-8')
+        except FileNotFoundError:
+            return None
+        except (OSError, zlib.error, UnicodeDecodeError) as e:
+            logger.warning(f"Estado anterior ilegível em '{path}', conversão completa: {str(e)}")
+            return None
+        state = cls()
+        try:
+            for line in text.splitlines():
+                if line.startswith('['):
+                    state.plans.append(decode_plan(line))
+                    continue
+                record = json.loads(line)
+                if 'versao' in record:
+                    if record['versao'] != STATE_VERSION:
+                        logger.warning(f"Estado anterior em '{path}' é de outra versão, conversão completa.")
+                        return None
+                    state.params = record['params']
+                else:
+                    state.pages.append(record)
+        except (ValueError, KeyError, IndexError) as e:
+            logger.warning(f"Estado anterior ilegível em '{path}', conversão completa: {str(e)}")
+            return None
+        return state
+
+    def save(self, path):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        compressor = zlib.compressobj(6)
+        try:
+            with open(tmp_path, 'wb') as f:
+                lines = [json.dumps({'versao': STATE_VERSION, 'params': self.params}, ensure_ascii=False)]
+                lines.extend(json.dumps(page, ensure_ascii=False, separators=(',', ':')) for page in self.pages)
+                lines.extend(encode_plan(plan_name, table) for plan_name, table in self.plans)
+                for line in lines:
+                    f.write(compressor.compress((line + '\n').encode('utf-8')))
+                f.write(compressor.flush())
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return path
+
+
+def _keyed_plans(plans):
+    # Nomes repetidos no mesmo PDF são comparados pela ordem em que aparecem
+    keyed = {}
+    seen = {}
+    for plan_name, table in plans:
+        occurrence = seen.get(plan_name, 0)
+        seen[plan_name] = occurrence + 1
+        label = plan_name if occurrence == 0 else f"{plan_name} #{occurrence + 1}"
+        keyed[label] = table
+    return keyed
+
+
+def _cells(table):
+    return {(option, brand): text for _, _, option, brand, text, _ in iter_long_rows('', '', table)}
+
+
+def _same_rate(old, new):
+    if old == new:
+        return True
+    old_rate, new_rate = parse_rate(old), parse_rate(new)
+    return old_rate != NO_RATE and old_rate == new_rate
+
+
+def iter_delta_rows(previous_plans, plans):
+    # Linhas do delta (ver DELTA_COLUMNS), célula a célula, com as bandeiras como extraídas
+    previous = _keyed_plans(previous_plans)
+    current = _keyed_plans(plans)
+    for label, table in current.items():
+        old_table = previous.get(label)
+        if old_table is None:
+            for (option, brand), text in _cells(table).items():
+                yield 'plano_adicionado', label, option, brand, '', text
+            continue
+        if old_table == table:
+            continue
+        old_cells = _cells(old_table)
+        new_cells = _cells(table)
+        for key, text in new_cells.items():
+            old_text = old_cells.get(key)
+            if old_text is None:
+                yield 'taxa_adicionada', label, key[0], key[1], '', text
+            elif not _same_rate(old_text, text):
+                yield 'taxa_alterada', label, key[0], key[1], old_text, text
+        for key, old_text in old_cells.items():
+            if key not in new_cells:
+                yield 'taxa_removida', label, key[0], key[1], old_text, ''
+    for label, old_table in previous.items():
+        if label not in current:
+            for (option, brand), text in _cells(old_table).items():
+                yield 'plano_removido', label, option, brand, text, ''
+
+
+def write_delta_csv(previous_plans, plans, path):
+    # Devolve quantos planos foram adicionados, removidos e alterados
+    changed = {'plano_adicionado': set(), 'plano_removido': set(), 'alterado': set()}
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f, delimiter=';')
+            writer.writerow(DELTA_COLUMNS)
+            for row in iter_delta_rows(previous_plans, plans):
+                writer.writerow(row)
+                changed.get(row[0], changed['alterado']).add(row[1])
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return {'adicionados': len(changed['plano_adicionado']), 'removidos': len(changed['plano_removido']),
+            'alterados': len(changed['alterado'])}
+
+
+def output_path(pdf_path, output_dir, suffix):
+    # <pasta de saída>/<nome do PDF><sufixo>, ao lado do <nome>_unificado.csv
+    output_dir = output_dir or os.path.dirname(pdf_path)
+    base_name = os.path.splitext(os.path.basename(pdf_path))[0]
+    return os.path.join(output_dir, base_name + suffix)
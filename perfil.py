@@ -0,0 +1,81 @@
+import csv
+import json
+import time
+
+# Etapas medidas, na ordem em que aparecem nos relatórios
+STAGES = [
+    'pdf_open',
+    'fingerprint',
+    'prefilter',
+    'extract_words',
+    'line_bucketing',
+    'column_assignment',
+    'replacement_resolution',
+    'consolidation',
+    'csv_write',
+    'export',
+]
+
+
+class RunProfile:
+    # Tempos acumulados por etapa e contadores por página de uma conversão. Os pontos de
+    # medição em taxas.py só existem quando um RunProfile é passado, então sem ele o custo é zero.
+    def __init__(self, source=None):
+        self.source = source
+        self.seconds = {}
+        self.calls = {}
+        self.pages = {}
+        self.started = time.perf_counter()
+        self.total_seconds = None
+
+    def add(self, stage, seconds, calls=1):
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+        self.calls[stage] = self.calls.get(stage, 0) + calls
+
+    def page(self, page_num, **counters):
+        # Soma contadores da página (words, lines, rows, ...); páginas começam em 1
+        entry = self.pages.setdefault(page_num, {})
+        for name, value in counters.items():
+            entry[name] = entry.get(name, 0) + value
+
+    def merge(self, other):
+        for stage, seconds in other['seconds'].items():
+            self.add(stage, seconds, other['calls'].get(stage, 0))
+        for page_num, counters in other['pages'].items():
+            self.page(int(page_num), **counters)
+
+    def finish(self):
+        self.total_seconds = time.perf_counter() - self.started
+
+    def to_dict(self):
+        ordered = [s for s in STAGES if s in self.seconds] + sorted(s for s in self.seconds if s not in STAGES)
+        return {
+            'source': self.source,
+            'total_seconds': self.total_seconds,
+            'seconds': {s: self.seconds[s] for s in ordered},
+            'calls': {s: self.calls[s] for s in ordered},
+            'pages': {page_num: self.pages[page_num] for page_num in sorted(self.pages)},
+        }
+
+    def summary(self):
+        parts = [f"{stage} {seconds:.3f}s" for stage, seconds in self.to_dict()['seconds'].items()]
+        return ", ".join(parts)
+
+    def export(self, path):
+        # .csv gera uma tabela longa (escopo;nome;valor); qualquer outra extensão gera JSON
+        data = self.to_dict()
+        if path.lower().endswith('.csv'):
+            with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+                writer = csv.writer(f, delimiter=';')
+                writer.writerow(['escopo', 'nome', 'valor'])
+                writer.writerow(['execucao', 'total_seconds', data['total_seconds']])
+                for stage, seconds in data['seconds'].items():
+                    writer.writerow(['etapa', stage, seconds])
+                    writer.writerow(['etapa_chamadas', stage, data['calls'][stage]])
+                for page_num, counters in data['pages'].items():
+                    for name, value in counters.items():
+                        writer.writerow([f"pagina:{page_num}", name, value])
+        else:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2, ensure_ascii=False)
+        return path
@@ -0,0 +1,52 @@
+import math
+import os
+
+import taxas
+from cache import ExtractionCache
+from configuracao import config_version
+from regras import ReplacementRules
+from sintetico import generate_rate_sheet
+
+# Latências guardadas para os percentis do status do servico.py e do vigia.py
+LATENCY_WINDOW = 1000
+
+# Processos de conversão de longa duração, compartilhados pelo servico.py e pelo vigia.py: cada
+# processo guarda o cache de extração e as regras já compiladas entre uma conversão e outra
+_state = {}
+
+
+def init_warm_worker(log_level, cache_dir, cache_max_bytes):
+    # initializer do ProcessPoolExecutor
+    taxas.init_worker(log_level)
+    _state['cache'] = ExtractionCache(cache_dir, cache_max_bytes) if cache_dir else None
+    # Aquecimento: o primeiro PDF de cada processo paga os imports tardios do pdfminer e do pdfium;
+    # um PDF sintético pequeno paga esse custo aqui, antes da primeira conversão
+    taxas.extract_data(generate_rate_sheet(None, plans=2, columns=4, brands=3, noise_pages=1))
+
+
+def worker_pid():
+    # Um envio por processo faz o pool criar todos eles (e rodar o aquecimento)
+    return os.getpid()
+
+
+def worker_cache():
+    return _state.get('cache')
+
+
+def load_config(config_file):
+    # Regras e grupos de bandeiras são recarregados só quando o config.ini ou o config.db mudam
+    version = config_version(config_file)
+    loaded = _state.get('config')
+    if loaded is None or loaded[0] != version:
+        rules = ReplacementRules(taxas.load_replacements(config_file))
+        loaded = (version, rules, taxas.load_brand_groups(config_file))
+        _state['config'] = loaded
+    return loaded[1], loaded[2]
+
+
+def percentile(sorted_values, p):
+    # Método do posto mais próximo
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
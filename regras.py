@@ -0,0 +1,149 @@
+import fnmatch
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Sintaxe das chaves em [REPLACEMENTS] (comparadas sem diferenciar maiúsculas, contra o nome inteiro do plano):
+#   plano a = Novo         nome exato
+#   plano a* = Novo        prefixo (só um '*', no final)
+#   plano ?x * = Novo      curinga ('*' e '?' em qualquer posição)
+#   ~plano \d+x = Novo     expressão regular (o ConfigParser não aceita ':' nem '=' na chave)
+# Nomes exatos e prefixos são guardados em minúsculas; curingas e expressões ficam como foram
+# escritos (\D não é \d) e são compilados com re.IGNORECASE.
+REGEX_PREFIX = '~'
+WILDCARD_CHARS = '*?'
+
+# O que fazer com regras exatas cujo plano não aparece no PDF:
+#   perguntar - abre a janela de escolha (só na interface)
+#   ignorar   - segue sem aplicar a regra e sem alterá-la
+#   manter    - mantém os nomes originais nesta conversão, sem alterar as regras gravadas
+#   falhar    - interrompe a conversão
+UNMATCHED_POLICIES = ['perguntar', 'ignorar', 'manter', 'falhar']
+
+
+class UnmatchedRulesError(ValueError):
+    def __init__(self, rules):
+        self.rules = rules
+        listed = ", ".join(f"'{find}' -> '{replace}'" for find, replace in rules[:5])
+        more = f" e mais {len(rules) - 5}" if len(rules) > 5 else ""
+        super().__init__(f"{len(rules)} regra(s) de substituição não encontrada(s) no PDF: {listed}{more}")
+
+
+def rule_kind(find):
+    if find.startswith(REGEX_PREFIX):
+        return 'regex'
+    if find.endswith('*') and not any(c in find[:-1] for c in WILDCARD_CHARS):
+        return 'prefix'
+    if any(c in find for c in WILDCARD_CHARS):
+        return 'wildcard'
+    return 'exact'
+
+
+def rule_key(find):
+    # Forma em que a regra é guardada e comparada (ver o comentário no início do arquivo)
+    return find.lower() if rule_kind(find) in ('exact', 'prefix') else find
+
+
+class ReplacementRules:
+    # Compila as regras uma vez: exatas num dict, prefixos numa trie e curingas/regex numa única
+    # expressão alternada. A regra exata vence; fora ela, vale a primeira regra de prefixo, curinga
+    # ou expressão que casar, na ordem do arquivo (cada uma guarda sua posição em 'order').
+    def __init__(self, plan_replacements):
+        self.exact = {}
+        self.prefixes = {}
+        self.patterns = []
+        self.resolved = {}
+        alternatives = []
+        for order, (find, replace) in enumerate(plan_replacements.items()):
+            key = rule_key(find)
+            kind = rule_kind(key)
+            if kind == 'exact':
+                self.exact[key] = replace
+            elif kind == 'prefix':
+                node = self.prefixes
+                for ch in key[:-1]:
+                    node = node.setdefault(ch, {})
+                node.setdefault(None, (order, replace))
+            else:
+                source = key[len(REGEX_PREFIX):] if kind == 'regex' else fnmatch.translate(key)
+                try:
+                    compiled = re.compile(source, re.IGNORECASE)
+                except re.error as e:
+                    logger.warning(f"Regra de substituição ignorada, padrão inválido '{find}': {e}")
+                    continue
+                self.patterns.append((compiled, order, replace))
+                # Padrões com grupos próprios ficam fora da alternação (a numeração dos grupos mudaria)
+                if not compiled.groups:
+                    alternatives.append(f"(?P<r{len(self.patterns) - 1}>{source})")
+        self.combined = None
+        if alternatives:
+            try:
+                self.combined = re.compile('|'.join(alternatives), re.IGNORECASE)
+            except re.error:
+                # Ex.: flags como (?x) no meio da expressão combinada; testa um padrão por vez
+                alternatives = []
+        self.grouped = [i for i, (compiled, _, _) in enumerate(self.patterns) if compiled.groups or not alternatives]
+
+    def __len__(self):
+        return len(self.exact) + self._count_prefixes(self.prefixes) + len(self.patterns)
+
+    def _count_prefixes(self, node):
+        return sum(1 if ch is None else self._count_prefixes(child) for ch, child in node.items())
+
+    def lookup(self, plan_name):
+        # Devolve o novo nome ou None se nenhuma regra se aplica
+        key = plan_name.lower()
+        if key in self.resolved:
+            return self.resolved[key]
+        replace = self.exact.get(key)
+        if replace is None:
+            # Entre os prefixos do nome, o que vem primeiro no arquivo; depois, o primeiro padrão
+            # que casa, se estiver antes dele
+            best = self.prefixes.get(None)
+            node = self.prefixes
+            for ch in key:
+                node = node.get(ch)
+                if node is None:
+                    break
+                rule = node.get(None)
+                if rule is not None and (best is None or rule[0] < best[0]):
+                    best = rule
+            if self.patterns:
+                rule = self._match_pattern(key)
+                if rule is not None and (best is None or rule[0] < best[0]):
+                    best = rule
+            if best is not None:
+                replace = best[1]
+        self.resolved[key] = replace
+        return replace
+
+    def _match_pattern(self, key):
+        # Devolve (ordem, substituto) do primeiro padrão que casa com o nome inteiro, ou None
+        first = len(self.patterns)
+        if self.combined is not None:
+            match = self.combined.fullmatch(key)
+            if match:
+                first = int(match.lastgroup[1:])
+        for i in self.grouped:
+            if i >= first:
+                break
+            if self.patterns[i][0].fullmatch(key):
+                first = i
+                break
+        if first == len(self.patterns):
+            return None
+        _, order, replace = self.patterns[first]
+        return order, replace
+
+    def rename(self, plan_name):
+        replace = self.lookup(plan_name)
+        return plan_name if replace is None else replace
+
+    def unmatched(self, found_names):
+        # found_names: nomes em minúsculas encontrados no PDF (set ou dict). Gera as regras exatas
+        # que não se aplicam a nenhum plano e cujo nome novo também não aparece (regra já aplicada).
+        # É consultado a cada passo, então quem chama pode atualizar found_names durante a iteração.
+        for find, replace in self.exact.items():
+            if find not in found_names and replace.lower() not in found_names:
+                yield find, replace
@@ -0,0 +1,353 @@
+import argparse
+import json
+import logging
+import os
+import socketserver
+import sys
+import threading
+import time
+import urllib.request
+from collections import deque
+from concurrent.futures import BrokenExecutor, CancelledError, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, quote
+
+import taxas
+from cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES
+from entrada import PdfSource
+from extratores import BACKENDS, DEFAULT_BACKEND
+from processos import LATENCY_WINDOW, init_warm_worker, load_config, percentile, worker_cache, worker_pid
+from regras import ReplacementRules
+from sintetico import generate_rate_sheet
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_MAX_QUEUE = 32
+MAX_UPLOAD_BYTES = 200 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+def convert_upload(pdf_bytes, name, config_file, options):
+    # Roda num processo do pool; devolve (csv em bytes, páginas, segundos de conversão)
+    rules, brand_groups = load_config(config_file)
+    stats = {}
+    started = time.perf_counter()
+    output = taxas.convert_to_buffer(PdfSource(pdf_bytes, name), rules, cache=worker_cache(),
+                                     brand_groups=brand_groups, stats=stats, **options)
+    return output.getvalue(), stats.get('pages', 0), time.perf_counter() - started
+
+
+def failure_response(error):
+    # (código HTTP, corpo) para uma conversão que falhou: o PDF enviado é o problema (422) ou o
+    # serviço é (pool de processos quebrado, tempo esgotado, falta de memória, disco)
+    if isinstance(error, (BrokenExecutor, CancelledError)):
+        logger.error(f"Pool de processos indisponível: {error!r}")
+        return 503, {'erro': "Serviço indisponível, processos de conversão encerrados"}
+    if isinstance(error, TimeoutError):
+        return 504, {'erro': "Tempo esgotado na conversão"}
+    if isinstance(error, (MemoryError, OSError)):
+        logger.error(f"Erro interno na conversão: {error!r}")
+        return 500, {'erro': f"Erro interno: {str(error)}"}
+    return 422, {'erro': str(error)}
+
+
+class ConversionService:
+    # Pool de processos já aquecidos e as métricas do serviço. Requisições além de
+    # workers + max_queue são recusadas em vez de acumular memória com PDFs esperando.
+    def __init__(self, workers=None, config_file='config.ini', max_queue=DEFAULT_MAX_QUEUE,
+                 cache_dir=DEFAULT_CACHE_DIR, cache_max_bytes=DEFAULT_MAX_BYTES, log_level=logging.WARNING):
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.config_file = config_file
+        self.max_queue = max_queue
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=init_warm_worker,
+                                            initargs=(log_level, cache_dir, cache_max_bytes))
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.pages = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.started = time.time()
+
+    def warm_up(self):
+        # Um envio por processo faz o pool criar todos eles agora (e rodar o aquecimento)
+        pids = {future.result() for future in [self.executor.submit(worker_pid) for _ in range(self.workers)]}
+        logger.info(f"{len(pids)} processos prontos")
+        return pids
+
+    def submit(self, pdf_bytes, name, options):
+        with self.lock:
+            if self.in_flight >= self.workers + self.max_queue:
+                self.rejected += 1
+                return None
+            self.in_flight += 1
+        try:
+            return self.executor.submit(convert_upload, pdf_bytes, name, self.config_file, options)
+        except BrokenExecutor as e:
+            # Pool quebrado (um processo morreu): a requisição falha como as que estavam nele
+            future = Future()
+            future.set_exception(e)
+            return future
+
+    def finish(self, seconds, ok, pages=0):
+        with self.lock:
+            self.in_flight -= 1
+            if ok:
+                self.completed += 1
+                self.pages += pages
+            else:
+                self.failed += 1
+            self.latencies.append(seconds)
+
+    def status(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            in_flight = self.in_flight
+            status = {
+                'workers': self.workers,
+                'em_andamento': min(in_flight, self.workers),
+                'fila': max(0, in_flight - self.workers),
+                'fila_max': self.max_queue,
+                'concluidas': self.completed,
+                'falhas': self.failed,
+                'recusadas': self.rejected,
+                'paginas': self.pages,
+                'ativo_ha_s': round(time.time() - self.started, 1),
+            }
+        status['latencia_ms'] = {name: None if value is None else round(value * 1000, 1) for name, value in [
+            ('p50', percentile(latencies, 50)),
+            ('p90', percentile(latencies, 90)),
+            ('p99', percentile(latencies, 99)),
+            ('max', latencies[-1] if latencies else None),
+        ]}
+        status['latencia_ms']['amostras'] = len(latencies)
+        return status
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+class ConversionHandler(BaseHTTPRequestHandler):
+    # POST /converter   corpo = PDF; devolve o CSV unificado (chunked)
+    #                   ?nome=arquivo.pdf  ?unificar=1  ?regras=falhar  ?extrator=pdfminer
+    # GET  /status      fila, processos e percentis de latência (JSON)
+    # GET  /saude       200 quando o serviço está de pé
+    protocol_version = 'HTTP/1.1'
+    server_version = 'ConversorTaxas/1.0'
+
+    def address_string(self):
+        # Em socket Unix o endereço do cliente é uma string vazia
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+    def log_message(self, format, *args):
+        logger.info(f"{self.address_string()} - {format % args}")
+
+    def _send_json(self, code, payload, extra_headers=()):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in extra_headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/status':
+            self._send_json(200, self.server.service.status())
+        elif path == '/saude':
+            self._send_json(200, {'ok': True})
+        else:
+            self._send_json(404, {'erro': "Caminho não encontrado"})
+
+    def do_POST(self):
+        started = time.perf_counter()
+        url = urlparse(self.path)
+        if url.path != '/converter':
+            self._send_json(404, {'erro': "Caminho não encontrado"})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            self.close_connection = True
+            self._send_json(400, {'erro': "Content-Length inválido"})
+            return
+        if length <= 0:
+            self._send_json(411, {'erro': "Envie o PDF no corpo da requisição, com Content-Length"})
+            return
+        if length > MAX_UPLOAD_BYTES:
+            self.close_connection = True
+            self._send_json(413, {'erro': f"PDF maior que {MAX_UPLOAD_BYTES // (1024 * 1024)} MB"})
+            return
+        pdf_bytes = self.rfile.read(length)
+
+        query = parse_qs(url.query)
+        name = query.get('nome', ['upload.pdf'])[0]
+        options = {
+            'dedupe_plans': query.get('unificar', ['0'])[0] == '1',
+            'unmatched_rules': 'falhar' if query.get('regras', [''])[0] == 'falhar' else 'ignorar',
+        }
+        backend = query.get('extrator', [DEFAULT_BACKEND])[0]
+        if backend not in BACKENDS:
+            self._send_json(400, {'erro': f"Extrator desconhecido: '{backend}'"})
+            return
+        options['backend'] = backend
+
+        service = self.server.service
+        future = service.submit(pdf_bytes, name, options)
+        del pdf_bytes
+        if future is None:
+            self._send_json(503, {'erro': "Fila cheia, tente novamente"}, [('Retry-After', '1')])
+            return
+        try:
+            csv_bytes, pages, seconds = future.result()
+        except Exception as e:
+            service.finish(time.perf_counter() - started, False)
+            self._send_json(*failure_response(e))
+            return
+
+        sent = False
+        try:
+            csv_name = os.path.splitext(os.path.basename(name))[0] + '_unificado.csv'
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/csv; charset=utf-8')
+            self.send_header('Content-Disposition', f"attachment; filename*=UTF-8''{quote(csv_name)}")
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.send_header('X-Paginas', str(pages))
+            self.send_header('X-Segundos-Conversao', f"{seconds:.3f}")
+            self.end_headers()
+            with memoryview(csv_bytes) as view:
+                for offset in range(0, len(view), CHUNK_SIZE):
+                    chunk = view[offset:offset + CHUNK_SIZE]
+                    self.wfile.write(b"%x\r\n" % len(chunk))
+                    self.wfile.write(chunk)
+                    self.wfile.write(b"\r\n")
+            self.wfile.write(b"0\r\n\r\n")
+            sent = True
+        finally:
+            # Cliente que desconectou no meio da resposta conta como falha
+            service.finish(time.perf_counter() - started, sent, pages)
+
+
+class ConversionHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service):
+        self.service = service
+        super().__init__(address, ConversionHandler)
+
+
+class ConversionUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, service):
+        self.service = service
+        if os.path.exists(path):
+            os.remove(path)
+        super().__init__(path, ConversionHandler)
+
+
+def serve(args):
+    log_level = logging.INFO if args.debug else logging.WARNING
+    taxas.init_worker(logging.INFO)
+    service = ConversionService(args.workers, args.config, args.fila_max,
+                                None if args.sem_cache else args.cache, args.cache_max_mb * 1024 * 1024, log_level)
+    started = time.perf_counter()
+    service.warm_up()
+    if args.socket:
+        server = ConversionUnixServer(args.socket, service)
+        where = args.socket
+    else:
+        server = ConversionHTTPServer((args.host, args.porta), service)
+        where = f"http://{args.host}:{server.server_address[1]}"
+    logger.info(f"Serviço pronto em {where} com {service.workers} processos ({time.perf_counter() - started:.2f}s para aquecer)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+    return 0
+
+
+def _post_pdf(url, pdf_bytes):
+    request = urllib.request.Request(url, data=pdf_bytes, method='POST', headers={'Content-Type': 'application/pdf'})
+    started = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=300) as response:
+        body = response.read()
+    return body, time.perf_counter() - started
+
+
+def self_test(args):
+    # Sobe o serviço numa porta livre de localhost, envia PDFs sintéticos em paralelo e confere
+    # cada resposta com a conversão local (convert_to_buffer) dos mesmos bytes
+    taxas.init_worker(logging.INFO if args.debug else logging.WARNING)
+    service = ConversionService(args.workers, args.config, args.fila_max, None, DEFAULT_MAX_BYTES)
+    service.warm_up()
+    server = ConversionHTTPServer((DEFAULT_HOST, 0), service)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://{DEFAULT_HOST}:{server.server_address[1]}"
+    try:
+        pdfs = [generate_rate_sheet(None, plans=args.planos, columns=10, brands=8, noise_pages=2, seed=i)
+                for i in range(args.requisicoes)]
+        rules = ReplacementRules(taxas.load_replacements(args.config))
+        brand_groups = taxas.load_brand_groups(args.config)
+        expected = [taxas.convert_to_buffer(pdf, rules, brand_groups=brand_groups).getvalue() for pdf in pdfs]
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concorrencia) as pool:
+            responses = list(pool.map(lambda pdf: _post_pdf(f"{base_url}/converter", pdf), pdfs))
+        elapsed = time.perf_counter() - started
+
+        mismatches = sum(1 for (body, _), csv_bytes in zip(responses, expected) if body != csv_bytes)
+        with urllib.request.urlopen(f"{base_url}/status") as response:
+            status = json.loads(response.read())
+        print(f"{len(pdfs)} requisições em {elapsed:.2f}s ({len(pdfs) / elapsed:.1f}/s) com concorrência {args.concorrencia}, "
+              f"{mismatches} respostas diferentes da conversão local")
+        print(json.dumps(status, indent=2, ensure_ascii=False))
+        return 1 if mismatches else 0
+    finally:
+        server.shutdown()
+        server.server_close()
+        service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serviço local de conversão de PDFs de taxas para CSV.")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1, help="Processos de conversão (padrão: número de CPUs)")
+    parser.add_argument('--config', default='config.ini', help="Arquivo de configuração com as regras de substituição")
+    parser.add_argument('--fila-max', type=int, default=DEFAULT_MAX_QUEUE, help="Requisições esperando além das em andamento antes de responder 503")
+    parser.add_argument('--debug', action='store_true', help="Mostra mais informações no log")
+    sub = parser.add_subparsers(dest='comando')
+
+    p = sub.add_parser('servir', help="Sobe o serviço (padrão)")
+    p.add_argument('--host', default=DEFAULT_HOST)
+    p.add_argument('--porta', type=int, default=DEFAULT_PORT)
+    p.add_argument('--socket', help="Escuta neste socket Unix em vez de TCP")
+    p.add_argument('--cache', default=DEFAULT_CACHE_DIR, help=f"Pasta do cache de extração (padrão: {DEFAULT_CACHE_DIR})")
+    p.add_argument('--cache-max-mb', type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024), help="Tamanho máximo do cache de extração em MB")
+    p.add_argument('--sem-cache', action='store_true', help="Não usa o cache de extração")
+
+    p = sub.add_parser('testar', help="Sobe o serviço em localhost, envia PDFs sintéticos e confere as respostas")
+    p.add_argument('--requisicoes', type=int, default=20)
+    p.add_argument('--concorrencia', type=int, default=4)
+    p.add_argument('--planos', type=int, default=30)
+
+    args = parser.parse_args(argv)
+    if args.comando == 'testar':
+        return self_test(args)
+    if args.comando is None:
+        args = parser.parse_args(list(argv or sys.argv[1:]) + ['servir'])
+    return serve(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
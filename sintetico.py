@@ -0,0 +1,106 @@
+import random
+
+import taxas
+
+# PDFs sintéticos no formato PAYTIME, sem dependências extras: usados pelo benchmark, pelos
+# autotestes do servico/vigia e para aquecer os processos do servico
+
+
+def _pdf_string(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def build_pdf(pages, page_width, page_height):
+    # PDF mínimo com Helvetica/WinAnsiEncoding (cobre "Débito" e "Crédito"); cada página é uma
+    # lista de comandos de texto já prontos
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"]
+    kids = []
+    for commands in pages:
+        stream = "\n".join(commands).encode('cp1252')
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>"
+                       % (page_width, page_height, len(objects)))
+        kids.append(len(objects))
+    objects[1] = ("<< /Type /Pages /Kids [%s] /Count %d >>" % (" ".join(f"{k} 0 R" for k in kids), len(kids))).encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def generate_rate_sheet(path, plans=10, columns=8, brands=8, noise_pages=2, seed=0):
+    # Gera um PDF de taxas no formato PAYTIME: páginas de ruído (capa, texto legal), depois os
+    # planos, cada um com uma linha "Plano ... PAYTIME Débito Crédito 2x ..." e uma linha por
+    # bandeira. Tabelas podem atravessar quebras de página. Metade dos planos tem VISA igual a
+    # Master Card e um terço tem Hipercard/American Express/Outros iguais (exceto no Débito),
+    # para exercitar a consolidação. Mesma semente, mesmo arquivo. Com path=None devolve os bytes do PDF.
+    rnd = random.Random(seed)
+    headers = ["Débito", "Crédito"] + [f"{i}x" for i in range(2, columns)]
+    brand_names = taxas.BANDEIRA_MAP[:brands]
+    column_x = [200 + i * 55 for i in range(len(headers))]
+    page_width = max(842, column_x[-1] + 60)
+    page_height = 595
+    line_height = 14
+
+    def rate():
+        return f"{rnd.randint(0, 5)},{rnd.randint(0, 99):02d}%"
+
+    def text(commands, x, y, value):
+        commands.append(f"BT /F1 8 Tf {x:.1f} {y:.1f} Td ({_pdf_string(value)}) Tj ET")
+
+    pages = []
+    for page_num in range(noise_pages):
+        commands = []
+        for i in range(30):
+            text(commands, 40, page_height - 35 - i * 16,
+                 f"Cláusula {page_num}.{i} - condições gerais de credenciamento, texto sem tabela {rnd.randint(0, 9999)}")
+        pages.append(commands)
+
+    commands = []
+    y = page_height - 35
+    for plan in range(plans):
+        if y < 60 + line_height:
+            pages.append(commands)
+            commands = []
+            y = page_height - 35
+        text(commands, 30, y, f"Plano Taxa{plan:05d} PAYTIME")
+        for x, header in zip(column_x, headers):
+            text(commands, x, y, header)
+        y -= line_height
+
+        rows = {}
+        for brand in brand_names:
+            if brand == 'Master Card' and plan % 2 == 0 and 'VISA' in rows:
+                values = rows['VISA']
+            elif brand in ('American Express', 'Outros') and plan % 3 == 0 and 'Hipercard' in rows:
+                values = [rate()] + rows['Hipercard'][1:]
+            else:
+                values = [rate() for _ in headers]
+            rows[brand] = values
+
+            if y < 40:
+                pages.append(commands)
+                commands = []
+                y = page_height - 35
+            text(commands, 30, y, brand)
+            for x, value in zip(column_x, values):
+                text(commands, x, y, value)
+            y -= line_height
+        y -= 10
+    pages.append(commands)
+
+    data = build_pdf(pages, page_width, page_height)
+    if path is None:
+        return data
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
@@ -0,0 +1,74 @@
+import re
+from array import array
+from functools import lru_cache
+
+# Taxas em ponto fixo: '1,99%' -> 19900 (quatro casas decimais do percentual). Textos que não
+# são uma taxa ('-', 'Isento', '1,23456%') ficam com NO_RATE e são comparados pelo texto.
+RATE_SCALE = 10000
+NO_RATE = -2 ** 63
+RATE_PATTERN = re.compile(r'^(-?)(\d+)(?:[.,](\d{1,4}))?\s*%$')
+EMPTY_VALUES = ('', '-')
+
+
+@lru_cache(maxsize=4096)
+def parse_rate(text):
+    # As mesmas poucas taxas se repetem pelo PDF inteiro; cada texto é convertido uma vez só
+    match = RATE_PATTERN.match(text)
+    if match is None:
+        return NO_RATE
+    sign, integer, fraction = match.groups()
+    value = int(integer) * RATE_SCALE + int((fraction or '').ljust(4, '0'))
+    return -value if sign else value
+
+
+class PlanTable:
+    # Tabela de um plano: uma linha por bandeira, uma coluna por forma de pagamento.
+    # Os textos ficam numa matriz densa (lista única, linha a linha) e as taxas já convertidas
+    # num array paralelo, então consolidação e comparações não refazem parsing nem buscas por chave.
+    __slots__ = ('headers', 'header_index', 'brands', 'brand_index', 'values', 'rates', '_columns')
+
+    def __init__(self, headers):
+        self.headers = list(headers)
+        # Cabeçalhos com o mesmo texto ficam com o valor da última coluna, como nas linhas em dict
+        self.header_index = {h: i for i, h in enumerate(self.headers)}
+        if len(self.header_index) != len(self.headers):
+            self._columns = [self.header_index[h] for h in self.headers]
+        else:
+            self._columns = None
+        self.brands = []
+        self.brand_index = {}
+        self.values = []
+        self.rates = array('q')
+
+    def __len__(self):
+        return len(self.brands)
+
+    def __eq__(self, other):
+        if not isinstance(other, PlanTable):
+            return NotImplemented
+        return self.headers == other.headers and self.brands == other.brands and self.values == other.values
+
+    def add_row(self, brand, values):
+        # values na ordem de headers. Linhas sem nenhum valor ('' ou '-') são descartadas
+        if self._columns is not None:
+            values = [values[i] for i in self._columns]
+        if all(v in EMPTY_VALUES for v in values):
+            return False
+        # brand_index aponta para a última linha da bandeira, como um dict montado das linhas
+        self.brand_index[brand] = len(self.brands)
+        self.brands.append(brand)
+        self.values.extend(values)
+        self.rates.extend(parse_rate(v) for v in values)
+        return True
+
+    def row(self, r):
+        width = len(self.headers)
+        return self.values[r * width:(r + 1) * width]
+
+    def rate_vector(self, r, columns):
+        # Chave de comparação da linha r nas colunas dadas: a taxa em ponto fixo ou, se o texto
+        # não é uma taxa, o próprio texto
+        base = r * len(self.headers)
+        rates = self.rates
+        values = self.values
+        return tuple(values[base + c] if rates[base + c] == NO_RATE else rates[base + c] for c in columns)
@@ -1,14 +1,1169 @@
-import pdfplumber
 import os
-import tkinter as tk
-from tkinter import filedialog, messagebox, ttk
+import sys
 import logging
+import logging.handlers
 import re
 import csv
 import configparser
+import glob
+import time
+import argparse
+import multiprocessing.util
+import queue
+import threading
+import io
+from bisect import bisect_right
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import hashlib
+import itertools
+from collections import deque
+from cache import ExtractionCache, DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES, encode_plan
+from perfil import RunProfile
+from regras import ReplacementRules, UnmatchedRulesError, UNMATCHED_POLICIES, rule_key, rule_kind
+from tabela import PlanTable
+from entrada import PdfSource
+from exportar import LONG_FORMATS, open_exporters, iter_exported, abort_exporters, close_exporters, export_plans
+from extratores import BACKENDS, DEFAULT_BACKEND, normalize_header_text
+from configuracao import ConfigStore, load_rules, store_path
+from incremental import ConversionState, page_fingerprints, write_delta_csv, output_path, STATE_SUFFIX, DELTA_SUFFIX
+
+logger = logging.getLogger(__name__)
+
+BANDEIRA_MAP = ["VISA", "Master Card", "Elo", "Hipercard", "American Express", "Outros", "Markup", "PIX"]
+
+# Bandeiras unificadas numa coluna só quando todas têm as mesmas taxas. Seções [GRUPO:<nome>]
+# no config.ini substituem esta lista (ver load_brand_groups).
+BRAND_GROUPS = [
+    {'name': 'Visa/Master', 'brands': ['VISA', 'Master Card'], 'exclude': [], 'base': 'VISA'},
+    {'name': 'Outros', 'brands': ['Hipercard', 'American Express', 'Outros'], 'exclude': ['Débito'], 'base': 'Outros'},
+]
+ALIAS_SEPARATOR = ' | '
+# Exportações oferecidas na interface; o banco SQLite fica na pasta de saída
+EXPORT_CHOICES = ['nenhum', 'sqlite'] + LONG_FORMATS
+SQLITE_FILE_NAME = 'taxas.db'
+# Linhas da lista de regras na interface; só elas são lidas do banco a cada atualização
+RULES_VISIBLE = 6
+# Planos com o mesmo nome e tabelas diferentes vindos de PDFs diferentes, ao juntar vários PDFs:
+# renomear acrescenta o nome do PDF, primeiro mantém só o que veio antes, falhar interrompe
+MERGE_CONFLICTS = ['renomear', 'primeiro', 'falhar']
+ORIGINS_COLUMNS = ['plano', 'arquivo', 'plano_no_pdf', 'situacao']
+
+# Parâmetros da extração; qualquer mudança aqui (ou no algoritmo, via EXTRACTOR_VERSION)
+# invalida as entradas do cache de extração.
+EXTRACTOR_VERSION = 1
+X_TOLERANCE = 1
+Y_TOLERANCE = 3
+LINE_BUCKET = 5.0
+# Folga acima do primeiro cabeçalho ao recortar a página: cobre a faixa de LINE_BUCKET e a
+# tolerância vertical do agrupamento de palavras, com sobra.
+HEADER_CROP_MARGIN = 2 * (LINE_BUCKET + Y_TOLERANCE)
+
+
+class ConversionCancelled(Exception):
+    pass
+
+
+class MergeConflictError(ValueError):
+    def __init__(self, plan_name, first_source, source):
+        self.plan_name = plan_name
+        super().__init__(f"O plano '{plan_name}' de '{source}' tem tabela diferente do mesmo plano em '{first_source}'.")
+
+
+def extraction_params(backend=DEFAULT_BACKEND):
+    params = {
+        'version': EXTRACTOR_VERSION,
+        'x_tolerance': X_TOLERANCE,
+        'y_tolerance': Y_TOLERANCE,
+        'line_bucket': LINE_BUCKET,
+        'bandeira_map': BANDEIRA_MAP,
+    }
+    # Só os outros extratores entram na chave, para não invalidar o cache já existente
+    if backend != DEFAULT_BACKEND:
+        params['backend'] = backend
+    return params
+
+
+def make_backend(name=DEFAULT_BACKEND):
+    if name not in BACKENDS:
+        raise ValueError(f"Extrator desconhecido: '{name}' (opções: {', '.join(BACKENDS)})")
+    return BACKENDS[name](X_TOLERANCE, Y_TOLERANCE, HEADER_CROP_MARGIN)
+
+
+def group_lines(words):
+    # Agrupa as palavras em linhas de LINE_BUCKET pt numa única passada: uma ordenação por
+    # (faixa vertical, x0) e um corte a cada mudança de faixa. O índice mantém a ordem original
+    # em caso de empate, como a ordenação estável por linha fazia.
+    keyed = sorted((round(w['top'] / LINE_BUCKET), w['x0'], i, w['text'], w['x1']) for i, w in enumerate(words))
+
+    page_lines = []
+    current_bucket = None
+    line_words = None
+    for bucket, x0, i, text, x1 in keyed:
+        if bucket != current_bucket:
+            current_bucket = bucket
+            line_words = []
+            page_lines.append(line_words)
+        line_words.append((text, x0, x1))
+    return page_lines
+
+
+def extract_page_lines(document, index, crop=False, profile=None, page_number=None):
+    # Palavras da página index do documento aberto pelo extrator, agrupadas em linhas de 5 pt e
+    # já ordenadas; cada palavra vira (texto, x0, x1). Com crop, só o que vem a partir do primeiro
+    # cabeçalho. Devolve (largura, linhas, caracteres descartados pelo recorte).
+    if profile is None:
+        page_width, words, chars_skipped = document.extract(index, crop)
+        return page_width, group_lines(words), chars_skipped
+
+    started = time.perf_counter()
+    page_width, words, chars_skipped = document.extract(index, crop)
+    extracted = time.perf_counter()
+    page_lines = group_lines(words)
+    profile.add('extract_words', extracted - started)
+    profile.add('line_bucketing', time.perf_counter() - extracted)
+    profile.page(page_number or index + 1, words=len(words), lines=len(page_lines))
+    return page_width, page_lines, chars_skipped
+
+
+def scan_pages(pdf_path, name=None):
+    # Primeira passada barata com o pdfium (já instalado com o pdfplumber): só o texto de cada
+    # página, sem o layout do pdfminer. Devolve [(tem_cabeçalho, nº de caracteres)] por página,
+    # ou None se não for possível ler o PDF assim.
+    try:
+        import pypdfium2 as pdfium
+    except ImportError:
+        return None
+    try:
+        doc = pdfium.PdfDocument(pdf_path)
+    except Exception as e:
+        logger.warning(f"Pré-filtro de páginas indisponível para '{name or pdf_path}': {str(e)}")
+        return None
+
+    pages = []
+    try:
+        for page_num in range(len(doc)):
+            page = doc[page_num]
+            text_page = page.get_textpage()
+            text = ''.join(text_page.get_text_range().split())
+            pages.append(("PAYTIME" in normalize_header_text(text), text_page.count_chars()))
+            text_page.close()
+            page.close()
+    finally:
+        doc.close()
+    return pages
+
+
+def assign_columns(line_words, column_lefts, column_rights):
+    # As colunas são intervalos contíguos [left, right) ordenados por left, então a coluna de
+    # cada palavra sai de uma busca binária pelo centro em vez de testar todas as colunas.
+    columns = [[] for _ in column_lefts]
+    for text, x0, x1 in line_words:
+        word_center = (x0 + x1) / 2
+        i = bisect_right(column_lefts, word_center) - 1
+        if i >= 0 and word_center < column_rights[i]:
+            columns[i].append(text)
+    return columns
+
+
+class PlanAccumulator:
+    # Máquina de estados que monta os planos a partir das linhas de cada página, em ordem.
+    # O estado (plano atual, cabeçalhos e linhas) atravessa as quebras de página; cada plano
+    # é devolvido assim que o próximo cabeçalho "PAYTIME" o fecha.
+    def __init__(self, debug=False, logger=logger):
+        self.debug = debug
+        self.logger = logger
+        self.current_plan_name = None
+        self.table = None
+        self.headers_with_boundaries = []
+        self.column_lefts = []
+        self.column_rights = []
+
+    def accepting_rows(self):
+        # Um plano aberto ainda pode receber linhas de bandeira da próxima página
+        return self.table is not None and len(self.table) < len(BANDEIRA_MAP)
+
+    def close_plan(self):
+        if self.current_plan_name and self.table:
+            return self.current_plan_name, self.table
+        return None
+
+    def set_headers(self, header_words, page_width):
+        for i, word in enumerate(header_words):
+            left = word[1]
+            right = header_words[i+1][1] if i + 1 < len(header_words) else page_width
+            self.headers_with_boundaries.append({'text': word[0], 'left': left, 'right': right})
+        self.column_lefts = [h['left'] for h in self.headers_with_boundaries]
+        self.column_rights = [h['right'] for h in self.headers_with_boundaries]
+        self.table = PlanTable([h['text'] for h in self.headers_with_boundaries])
+
+    def feed_page(self, page_width, page_lines, profile=None, page_num=None):
+        bandeira_map = BANDEIRA_MAP
+        closed_plans = []
+        rows_added = 0
+        assign_seconds = 0.0
+        assign_calls = 0
+        for line_words in page_lines:
+            line_text = ' '.join(w[0] for w in line_words)
+
+            if "PAYTIME" in line_text.upper().replace("Ν", "N"):
+                closed = self.close_plan()
+                if closed:
+                    closed_plans.append(closed)
+
+                self.table = None
+                self.headers_with_boundaries = []
+
+                match = re.search(r'^(.*?PAYTIME.*?)(Débito.*)$', line_text, re.IGNORECASE)
+                if match:
+                    self.current_plan_name = match.group(1).strip()
+                    header_text_part = match.group(2)
+                    header_words = [w for w in line_words if w[0] in header_text_part]
+                else:
+                    self.current_plan_name = line_text
+                    header_words = []
+
+                if self.debug: self.logger.info(f"Plano encontrado: {self.current_plan_name}")
+
+                if header_words:
+                    self.set_headers(header_words, page_width)
+                    if self.debug: self.logger.info(f"Taxas registradas")
+                continue
+
+            if self.table is not None:
+                bandeira_idx = len(self.table)
+                if bandeira_idx < len(bandeira_map):
+                    if profile is not None: started = time.perf_counter()
+                    columns = assign_columns(line_words, self.column_lefts, self.column_rights)
+                    row_values = [' '.join(column_words).strip() if column_words else "-" for column_words in columns]
+
+                    if self.table.add_row(bandeira_map[bandeira_idx], row_values):
+                        rows_added += 1
+                    if profile is not None:
+                        assign_seconds += time.perf_counter() - started
+                        assign_calls += 1
+
+        if profile is not None:
+            profile.add('column_assignment', assign_seconds, assign_calls)
+            profile.page(page_num, rows=rows_added)
+        return closed_plans
+
+    def finish(self):
+        closed = self.close_plan()
+        return [closed] if closed else []
+
+
+def _extract_page_range(pdf_path, first, last, profiled=False, backend=DEFAULT_BACKEND):
+    profile = RunProfile() if profiled else None
+    with make_backend(backend).open(pdf_path, first, last) as document:
+        pages = [extract_page_lines(document, i, profile=profile, page_number=first + i + 1)[:2] for i in range(len(document))]
+    return pages, profile.to_dict() if profile else None
+
+
+def _page_ranges(page_count, chunks):
+    chunk_size = max(1, -(-page_count // chunks))
+    return [(first, min(first + chunk_size, page_count)) for first in range(0, page_count, chunk_size)]
+
+
+def iter_plans(pdf_path, debug=False, logger=logger, stats=None, page_workers=1, cache=None, prefilter=True,
+               progress=None, profile=None, backend=DEFAULT_BACKEND, reuse_pages=None, page_records=None):
+    # Gera (nome_do_plano, PlanTable) na ordem do PDF, sem manter o documento inteiro
+    # em memória: o cache de cada página é liberado assim que suas linhas são extraídas.
+    # progress(páginas_feitas, total) é chamado após cada página; para interromper a extração
+    # entre páginas, ele pode levantar ConversionCancelled. profile (perfil.RunProfile) recebe
+    # os tempos por etapa e os contadores por página.
+    # pdf_path também pode ser bytes, mmap ou um arquivo aberto (ver entrada.PdfSource).
+    # backend escolhe a fonte dos caracteres (ver extratores.BACKENDS).
+    # Reconversão incremental (ver incremental.py): reuse_pages ({impressão digital: página}) são
+    # as páginas da conversão anterior, usadas no lugar de extrair de novo as que não mudaram, e
+    # page_records recebe as páginas desta conversão. Nos dois casos a extração é sequencial e sem cache.
+    source = PdfSource(pdf_path)
+    incremental = reuse_pages is not None or page_records is not None
+    if cache is not None and not incremental:
+        extract = lambda cache_stats: iter_plans(source, debug, logger, cache_stats, page_workers,
+                                                 prefilter=prefilter, progress=progress, profile=profile, backend=backend)
+        yield from cache.iter_plans(source, extraction_params(backend), extract, stats)
+        return
+
+    if stats is None:
+        stats = {}
+    stats['skipped_pages'] = 0
+    stats['skipped_chars'] = 0
+    stats['reused_pages'] = 0
+    accumulator = PlanAccumulator(debug, logger)
+
+    # O extrator só carrega o pdfplumber/pdfminer ao abrir o documento: --help, a interface e
+    # as conversões atendidas pelo cache não pagam esse import
+    extractor = make_backend(backend)
+    started = time.perf_counter()
+    with source.reader() as pdf_file, extractor.open(pdf_file) as document:
+        page_count = len(document)
+        stats['pages'] = page_count
+        if profile is not None:
+            profile.add('pdf_open', time.perf_counter() - started)
+
+        # Os processos de páginas reabrem o PDF pelo caminho; entradas em memória ficam no sequencial
+        if page_workers <= 1 or page_count < 2 or source.path is None or incremental:
+            fingerprints = None
+            if incremental:
+                started = time.perf_counter()
+                with source.reader() as fingerprint_file:
+                    fingerprints = page_fingerprints(fingerprint_file)
+                if profile is not None:
+                    profile.add('fingerprint', time.perf_counter() - started)
+            reuse_pages = reuse_pages or {}
+
+            started = time.perf_counter()
+            page_scan = None
+            if prefilter:
+                with source.reader() as scan_file:
+                    page_scan = scan_pages(scan_file, source.name)
+            if page_scan is not None and len(page_scan) != page_count:
+                page_scan = None
+            if profile is not None and prefilter:
+                profile.add('prefilter', time.perf_counter() - started)
+
+            for page_num in range(page_count):
+                fingerprint = fingerprints[page_num] if fingerprints else None
+                previous = reuse_pages.get(fingerprint)
+                # Páginas recortadas ou puladas na conversão anterior só servem se, aqui também,
+                # nenhum plano está esperando linhas delas
+                if previous is not None and (previous['mode'] == 'full' or not accumulator.accepting_rows()):
+                    stats['reused_pages'] += 1
+                    if previous['mode'] == 'skip':
+                        stats['skipped_pages'] += 1
+                    stats['skipped_chars'] += previous['skipped_chars']
+                    if page_records is not None: page_records.append(previous)
+                    if profile is not None: profile.page(page_num + 1, reused=1)
+                    if progress: progress(page_num + 1, page_count)
+                    yield from accumulator.feed_page(previous['width'], previous['lines'], profile, page_num + 1)
+                    continue
+
+                crop = False
+                if page_scan is not None and not accumulator.accepting_rows():
+                    has_header, char_count = page_scan[page_num]
+                    if not has_header:
+                        # Sem cabeçalho e sem plano esperando linhas: nada nesta página vai para o CSV
+                        stats['skipped_pages'] += 1
+                        stats['skipped_chars'] += char_count
+                        if page_records is not None:
+                            page_records.append({'fp': fingerprint, 'mode': 'skip', 'width': 0, 'lines': [],
+                                                 'skipped_chars': char_count})
+                        if profile is not None: profile.page(page_num + 1, skipped=1, chars_skipped=char_count)
+                        if progress: progress(page_num + 1, page_count)
+                        continue
+                    # Nenhum plano esperando linhas: o que vem antes do primeiro cabeçalho é
+                    # descartado pelo PlanAccumulator de qualquer forma
+                    crop = True
+
+                page_width, page_lines, chars_skipped = extract_page_lines(document, page_num, crop, profile)
+                stats['skipped_chars'] += chars_skipped
+                if page_records is not None:
+                    page_records.append({'fp': fingerprint, 'mode': 'crop' if chars_skipped else 'full', 'width': page_width,
+                                         'lines': page_lines, 'skipped_chars': chars_skipped})
+                if progress: progress(page_num + 1, page_count)
+                yield from accumulator.feed_page(page_width, page_lines, profile, page_num + 1)
+            yield from accumulator.finish()
+            if debug and page_scan is not None:
+                logger.info(f"Pré-filtro: {stats['skipped_pages']} páginas e {stats['skipped_chars']} caracteres ignorados")
+            return
+
+    # Cada processo abre o PDF e extrai um intervalo contínuo de páginas; a costura dos planos
+    # que atravessam os intervalos é feita aqui, alimentando as páginas na ordem original.
+    page_workers = min(page_workers, page_count)
+    ranges = _page_ranges(page_count, page_workers * 2)
+    with ProcessPoolExecutor(max_workers=page_workers) as executor:
+        futures = [executor.submit(_extract_page_range, source.path, first, last, profile is not None, backend)
+                   for first, last in ranges]
+        pages_done = 0
+        try:
+            while futures:
+                pages, worker_profile = futures.pop(0).result()
+                if worker_profile:
+                    profile.merge(worker_profile)
+                for page_width, page_lines in pages:
+                    pages_done += 1
+                    if progress: progress(pages_done, page_count)
+                    yield from accumulator.feed_page(page_width, page_lines, profile, pages_done)
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+    yield from accumulator.finish()
+
+
+def extract_data(pdf_path, debug=False, logger=logger, stats=None, page_workers=1, cache=None, prefilter=True,
+                 progress=None, profile=None, backend=DEFAULT_BACKEND):
+    # Lista de (nome, PlanTable) na ordem do PDF. Um nome repetido aparece uma vez por ocorrência,
+    # como no CSV gravado por write_unified_csv a partir de iter_plans.
+    return list(iter_plans(pdf_path, debug, logger, stats, page_workers, cache, prefilter, progress, profile, backend))
+
+
+def iter_replaced(plans, plan_replacements, profile=None, found_names=None):
+    # plan_replacements pode ser o dict do config.ini ou um ReplacementRules já compilado.
+    # found_names (set), se passado, recebe os nomes originais em minúsculas
+    rules = plan_replacements if isinstance(plan_replacements, ReplacementRules) else ReplacementRules(plan_replacements)
+    for plan_name, data in plans:
+        if found_names is not None:
+            found_names.add(plan_name.lower())
+        if profile is None:
+            yield rules.rename(plan_name), data
+            continue
+        started = time.perf_counter()
+        new_name = rules.rename(plan_name)
+        profile.add('replacement_resolution', time.perf_counter() - started)
+        yield new_name, data
+
+
+def apply_replacements(all_plans, plan_replacements):
+    if isinstance(all_plans, dict):
+        all_plans = all_plans.items()
+    return list(iter_replaced(all_plans, plan_replacements))
+
+
+def consolidate_plan(table, brand_groups=None):
+    # Cada grupo só é unificado se todas as bandeiras dele estão no plano e têm o mesmo vetor de
+    # taxas (sem as colunas em 'exclude'); a coluna unificada leva as taxas da bandeira 'base'.
+    # Devolve os nomes das colunas do bloco e, para cada uma, a linha da tabela de onde vêm as taxas.
+    brand_groups = BRAND_GROUPS if brand_groups is None else brand_groups
+    headers = table.headers
+    brand_index = table.brand_index
+    brand_names_to_keep = []
+    source_rows = []
+
+    merged_groups = {}
+    for group in brand_groups:
+        members = group['brands']
+        if not all(brand in brand_index and brand not in merged_groups for brand in members):
+            continue
+        columns = [c for c, h in enumerate(headers) if h not in group['exclude']]
+        rate_vectors = {table.rate_vector(brand_index[brand], columns) for brand in members}
+        if len(rate_vectors) == 1:
+            for brand in members:
+                merged_groups[brand] = group
+
+    processed_brands = set()
+    for r, brand in enumerate(table.brands):
+        if brand in processed_brands:
+            continue
+
+        group = merged_groups.get(brand)
+        if group is not None:
+            brand_names_to_keep.append(group['name'])
+            source_rows.append(brand_index[group['base']])
+            processed_brands.update(group['brands'])
+        else:
+            brand_names_to_keep.append(brand)
+            source_rows.append(r)
+            processed_brands.add(brand)
+
+    return brand_names_to_keep, source_rows
+
+
+def plan_block(table, brand_groups=None):
+    # Bloco do CSV sem o nome do plano: bandeiras (colunas) e uma linha por forma de pagamento
+    brand_names_to_keep, source_rows = consolidate_plan(table, brand_groups)
+    width = len(table.headers)
+    values = table.values
+    offsets = [r * width for r in source_rows]
+    rows = [[option] + [values[offset + c] for offset in offsets] for c, option in enumerate(table.headers)]
+    return brand_names_to_keep, rows
+
+
+def write_unified_csv(plans, csv_file, logger=logger, profile=None, brand_groups=None, dedupe=False):
+    # Aceita o dicionário de planos ou qualquer iterável de (nome, dados), como iter_plans;
+    # cada bloco é consolidado e gravado assim que chega. Devolve quantos planos foram gravados
+    # (com dedupe, contando também os que saíram no bloco de outro plano).
+    # Com dedupe, planos com a tabela idêntica saem num bloco só, com os nomes separados por
+    # ALIAS_SEPARATOR; só os blocos distintos ficam em memória até o fim.
+    # csv_file pode ser um caminho ou um arquivo de texto já aberto (ex.: io.TextIOWrapper em memória).
+    if isinstance(plans, dict):
+        plans = plans.items()
+    written_names = set()
+    written = 0
+    unique_blocks = {}
+
+    if hasattr(csv_file, 'write'):
+        output = nullcontext(csv_file)
+    else:
+        output = open(csv_file, 'w', newline='', encoding='utf-8-sig')
+    with output as f:
+        writer = csv.writer(f, delimiter=';', quoting=csv.QUOTE_ALL)
+
+        for plan_name, table in plans:
+            if not table:
+                logger.warning(f"Nenhum dado de linha encontrado para o plano '{plan_name}'. Ignorando.")
+                continue
+            if plan_name in written_names and not dedupe:
+                logger.warning(f"O plano '{plan_name}' aparece mais de uma vez no PDF; o bloco será repetido no CSV.")
+            written_names.add(plan_name)
+            written += 1
+
+            if profile is not None: started = time.perf_counter()
+            brand_names_to_keep, rows = plan_block(table, brand_groups)
+            if dedupe:
+                key = (tuple(brand_names_to_keep), tuple(map(tuple, rows)))
+                aliases = unique_blocks.setdefault(key, [])
+                if plan_name not in aliases:
+                    aliases.append(plan_name)
+                if profile is not None:
+                    profile.add('consolidation', time.perf_counter() - started)
+                continue
+            if profile is not None:
+                consolidated = time.perf_counter()
+                profile.add('consolidation', consolidated - started)
+
+            writer.writerow([plan_name] + brand_names_to_keep)
+            writer.writerows(rows)
+            writer.writerow([])
+            writer.writerow([])
+            if profile is not None:
+                profile.add('csv_write', time.perf_counter() - consolidated)
+
+        if dedupe:
+            if profile is not None: started = time.perf_counter()
+            for (brand_names_to_keep, rows), aliases in unique_blocks.items():
+                writer.writerow([ALIAS_SEPARATOR.join(aliases)] + list(brand_names_to_keep))
+                writer.writerows(rows)
+                writer.writerow([])
+                writer.writerow([])
+            if profile is not None:
+                profile.add('csv_write', time.perf_counter() - started)
+            merged = written - len(unique_blocks)
+            if merged:
+                logger.info(f"{merged} planos com tabela idêntica a outro foram unificados ({len(unique_blocks)} blocos no CSV).")
+
+    return written
+
+
+def unified_csv_path(pdf_path, output_dir=None):
+    output_dir = output_dir or os.path.dirname(pdf_path)
+    base_name = os.path.splitext(os.path.basename(pdf_path))[0]
+    return os.path.join(output_dir, f"{base_name}_unificado.csv")
+
+
+def load_replacements(config_file='config.ini'):
+    # Do config.db quando a interface já importou as regras para ele (ver configuracao.py)
+    return load_rules(config_file)
+
+
+def load_brand_groups(config_file='config.ini'):
+    # [GRUPO:Visa/Master]
+    # bandeiras = VISA, Master Card
+    # ignorar_colunas = Débito      (opcional)
+    # base = VISA                   (opcional, padrão: a primeira bandeira)
+    config = configparser.ConfigParser()
+    if os.path.exists(config_file):
+        config.read(config_file, encoding='utf-8')
+    groups = []
+    for section in config.sections():
+        if not section.startswith('GRUPO:'):
+            continue
+        brands = [b.strip() for b in config[section].get('bandeiras', '').split(',') if b.strip()]
+        if not brands:
+            logger.warning(f"Grupo '{section}' sem bandeiras no arquivo de configuração. Ignorando.")
+            continue
+        exclude = [h.strip() for h in config[section].get('ignorar_colunas', '').split(',') if h.strip()]
+        base = config[section].get('base', brands[0]).strip()
+        if base not in brands:
+            logger.warning(f"A base '{base}' do grupo '{section}' não está entre as bandeiras; usando '{brands[0]}'.")
+            base = brands[0]
+        groups.append({'name': section[len('GRUPO:'):].strip(), 'brands': brands, 'exclude': exclude, 'base': base})
+    return groups or BRAND_GROUPS
+
+
+def show_config(config_file='config.ini', out=sys.stdout):
+    # Inspeção da configuração sem abrir a interface nem carregar o pdfplumber
+    replacements = load_replacements(config_file)
+    if not os.path.exists(config_file):
+        print(f"'{config_file}' não existe; usando a configuração padrão.", file=out)
+    source = store_path(config_file) if os.path.exists(store_path(config_file)) else config_file
+    print(f"Regras de substituição ({len(replacements)}, de '{source}'):", file=out)
+    for find, replace in replacements.items():
+        print(f"  [{rule_kind(find)}] '{find}' -> '{replace}'", file=out)
+    print("Grupos de bandeiras:", file=out)
+    for group in load_brand_groups(config_file):
+        exclude = f", ignorando {', '.join(group['exclude'])}" if group['exclude'] else ""
+        print(f"  {group['name']}: {', '.join(group['brands'])} (base {group['base']}{exclude})", file=out)
+
+
+def convert_file(pdf_path, output_dir=None, plan_replacements=None, debug=False, page_workers=1,
+                 cache_dir=None, cache_max_bytes=None, prefilter=True, profile_format=None, unmatched_rules='ignorar',
+                 brand_groups=None, dedupe_plans=False, sqlite_path=None, long_format=None, backend=DEFAULT_BACKEND,
+                 incremental=False, previous_state=None):
+    # profile_format ('json' ou 'csv') grava os tempos por etapa em <nome>_perfil.<formato>
+    # unmatched_rules: 'ignorar' ou 'falhar' para regras exatas sem plano correspondente (ver regras.py)
+    # sqlite_path e long_format gravam também a tabela longa de taxas (ver exportar.py)
+    # incremental reaproveita as páginas sem mudança da conversão anterior (<nome>_estado.z, ou o
+    # arquivo em previous_state) e grava o <nome>_delta.csv com o que mudou (ver incremental.py)
+    result = {'pdf': pdf_path, 'csv': None, 'pages': 0, 'plans': 0, 'seconds': 0.0, 'error': None, 'cache': None,
+              'skipped_pages': 0, 'skipped_chars': 0, 'profile': None, 'exports': [], 'reused_pages': 0,
+              'delta': None, 'changes': None}
+    started = time.perf_counter()
+    profile = RunProfile(source=pdf_path) if profile_format else None
+    try:
+        stats = {}
+        cache = None
+        if cache_dir and not incremental:
+            cache = ExtractionCache(cache_dir, DEFAULT_MAX_BYTES if cache_max_bytes is None else cache_max_bytes)
+        csv_file = unified_csv_path(pdf_path, output_dir)
+        page_records = reuse_pages = previous = None
+        if incremental:
+            state_file = output_path(pdf_path, os.path.dirname(csv_file), STATE_SUFFIX)
+            previous = ConversionState.load(previous_state or state_file)
+            page_records = []
+            # Páginas extraídas com outros parâmetros (tolerâncias, extrator) não servem
+            if previous is not None and previous.params == extraction_params(backend):
+                reuse_pages = previous.pages_by_fingerprint()
+        plans = iter_plans(pdf_path, debug=debug, stats=stats, page_workers=page_workers, cache=cache, prefilter=prefilter,
+                           profile=profile, backend=backend, reuse_pages=reuse_pages, page_records=page_records)
+        rules = plan_replacements if isinstance(plan_replacements, ReplacementRules) else ReplacementRules(plan_replacements or {})
+        found_names = set()
+        current_plans = []
+        exporters = open_exporters(pdf_path, os.path.dirname(csv_file), sqlite_path, long_format)
+        try:
+            plans = iter_exported(iter_replaced(plans, rules, profile, found_names), exporters)
+            if incremental:
+                plans = _iter_recorded(plans, current_plans)
+            written = write_unified_csv(plans, csv_file, profile=profile, brand_groups=brand_groups, dedupe=dedupe_plans)
+            if unmatched_rules == 'falhar' and written:
+                missing = list(rules.unmatched(found_names))
+                if missing:
+                    raise UnmatchedRulesError(missing)
+        except Exception:
+            # Não deixa um CSV truncado (nem exportações pela metade) para trás
+            abort_exporters(exporters)
+            if os.path.exists(csv_file):
+                os.remove(csv_file)
+            raise
+        result['pages'] = stats.get('pages', 0)
+        result['skipped_pages'] = stats.get('skipped_pages', 0)
+        result['skipped_chars'] = stats.get('skipped_chars', 0)
+        if cache is not None:
+            result['cache'] = 'hit' if cache.hits else 'miss'
+        if not written:
+            abort_exporters(exporters)
+            os.remove(csv_file)
+            raise ValueError("Nenhum dado estruturado foi encontrado no PDF.")
+        if profile is not None: started_export = time.perf_counter()
+        try:
+            result['exports'] = close_exporters(exporters)
+        except Exception:
+            # Exportação que não pôde ser publicada: o PDF falha por inteiro, como nos outros erros
+            os.remove(csv_file)
+            raise
+        if profile is not None and exporters:
+            profile.add('export', time.perf_counter() - started_export)
+        result['csv'] = csv_file
+        result['plans'] = written
+        if incremental:
+            result['reused_pages'] = stats.get('reused_pages', 0)
+            delta_file = output_path(pdf_path, os.path.dirname(csv_file), DELTA_SUFFIX)
+            result['changes'] = write_delta_csv(previous.plans if previous is not None else [], current_plans, delta_file)
+            result['delta'] = delta_file
+            ConversionState(extraction_params(backend), page_records, current_plans).save(state_file)
+        if profile is not None:
+            profile.finish()
+            base_name = os.path.splitext(os.path.basename(pdf_path))[0]
+            profile_file = os.path.join(os.path.dirname(csv_file), f"{base_name}_perfil.{profile_format}")
+            result['profile'] = profile.export(profile_file)
+    except Exception as e:
+        logger.error(f"Erro ao converter '{pdf_path}': {str(e)}", exc_info=debug)
+        result['error'] = str(e)
+    result['seconds'] = time.perf_counter() - started
+    return result
+
+
+def _iter_recorded(plans, recorded):
+    for plan_name, table in plans:
+        recorded.append((plan_name, table))
+        yield plan_name, table
+
+
+def convert_to_buffer(source, plan_replacements=None, debug=False, cache=None, prefilter=True, unmatched_rules='ignorar',
+                      brand_groups=None, dedupe_plans=False, stats=None, backend=DEFAULT_BACKEND):
+    # Conversão sem arquivos: PDF em bytes, mmap ou arquivo aberto (ver entrada.PdfSource) e o CSV,
+    # com os mesmos bytes que convert_file gravaria, devolvido num io.BytesIO posicionado no início
+    source = PdfSource(source)
+    rules = plan_replacements if isinstance(plan_replacements, ReplacementRules) else ReplacementRules(plan_replacements or {})
+    found_names = set()
+    output = io.BytesIO()
+    text = io.TextIOWrapper(output, encoding='utf-8-sig', newline='')
+    plans = iter_plans(source, debug, stats=stats, cache=cache, prefilter=prefilter, backend=backend)
+    written = write_unified_csv(iter_replaced(plans, rules, found_names=found_names), text,
+                                brand_groups=brand_groups, dedupe=dedupe_plans)
+    text.flush()
+    text.detach()
+    if not written:
+        raise ValueError("Nenhum dado estruturado foi encontrado no PDF.")
+    if unmatched_rules == 'falhar':
+        missing = list(rules.unmatched(found_names))
+        if missing:
+            raise UnmatchedRulesError(missing)
+    output.seek(0)
+    return output
+
+
+def expand_inputs(patterns):
+    # Aceita arquivos, pastas (todos os PDFs dentro) e globs - o shell do Windows não expande '*'
+    paths = []
+    seen = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = sorted(glob.glob(os.path.join(pattern, '*.pdf')) + glob.glob(os.path.join(pattern, '*.PDF')))
+        elif glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern, recursive=True))
+        else:
+            matches = [pattern]
+        for path in matches:
+            key = os.path.abspath(path)
+            if key not in seen:
+                seen.add(key)
+                paths.append(path)
+    return paths
+
+
+LOG_FORMAT = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', '%Y-%m-%d %H:%M:%S')
+
+
+def start_queue_logging(target_logger, handlers, level=logging.INFO):
+    # O logger só enfileira os registros; a escrita (arquivo, terminal) acontece na thread do
+    # QueueListener, fora do caminho da extração. Devolve a função que para o listener e esvazia a fila.
+    log_queue = queue.SimpleQueue()
+    for handler in handlers:
+        handler.setFormatter(LOG_FORMAT)
+    target_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    target_logger.setLevel(level)
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    # Os processos do pool terminam sem rodar atexit; os finalizadores do multiprocessing
+    # rodam nos dois casos e garantem que a fila seja esvaziada
+    # (e só chamam listener.stop uma vez, mesmo que a função devolvida já tenha sido usada)
+    return multiprocessing.util.Finalize(None, listener.stop, exitpriority=10)
+
+
+def init_worker(log_level):
+    # Com fork o processo filho herda o QueueHandler do pai, mas não a thread que esvazia a fila
+    root_logger = logging.getLogger()
+    for handler in [h for h in root_logger.handlers if isinstance(h, logging.handlers.QueueHandler)]:
+        root_logger.removeHandler(handler)
+    start_queue_logging(root_logger, [logging.StreamHandler(sys.stderr)], log_level)
+
+
+def run_batch(pdf_paths, workers=None, out=sys.stdout, **options):
+    # options são repassadas para convert_file (output_dir, plan_replacements, debug, ...)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(pdf_paths)))
+    started = time.perf_counter()
+    results = []
+
+    def report(result):
+        results.append(result)
+        if result['error']:
+            print(f"FALHA {result['pdf']}: {result['error']}", file=out)
+        else:
+            print(f"OK    {result['pdf']} -> {result['csv']} ({result['pages']} páginas, {result['plans']} planos, {result['seconds']:.2f}s)", file=out)
+            if result['delta']:
+                changes = result['changes']
+                print(f"      {result['reused_pages']} páginas reaproveitadas; planos: {changes['adicionados']} adicionados, "
+                      f"{changes['removidos']} removidos, {changes['alterados']} alterados -> {result['delta']}", file=out)
+
+    if workers == 1:
+        for pdf_path in pdf_paths:
+            report(convert_file(pdf_path, **options))
+    else:
+        log_level = logging.getLogger().getEffectiveLevel()
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(log_level,)) as executor:
+            futures = [executor.submit(convert_file, pdf_path, **options) for pdf_path in pdf_paths]
+            for future in as_completed(futures):
+                report(future.result())
+
+    elapsed = time.perf_counter() - started
+    total_pages = sum(r['pages'] for r in results)
+    failures = sum(1 for r in results if r['error'])
+    files_per_s = len(results) / elapsed if elapsed else 0.0
+    pages_per_s = total_pages / elapsed if elapsed else 0.0
+    print(f"\n{len(results)} arquivos, {total_pages} páginas em {elapsed:.2f}s com {workers} processos "
+          f"({files_per_s:.2f} arquivos/s, {pages_per_s:.2f} páginas/s), {failures} falhas", file=out)
+    skipped_pages = sum(r['skipped_pages'] for r in results)
+    if skipped_pages:
+        skipped_chars = sum(r['skipped_chars'] for r in results)
+        print(f"Pré-filtro: {skipped_pages} páginas sem tabela ignoradas, {skipped_chars} caracteres não processados", file=out)
+    if options.get('cache_dir'):
+        hits = sum(1 for r in results if r['cache'] == 'hit')
+        misses = sum(1 for r in results if r['cache'] == 'miss')
+        print(f"Cache de extração: {hits} hits, {misses} misses ({options['cache_dir']})", file=out)
+    return results
+
+
+def _plans_difference(expected, actual):
+    # Primeira diferença entre duas listas de (nome, PlanTable), ou None se são idênticas
+    if isinstance(expected, Exception) or isinstance(actual, Exception):
+        if type(expected) is type(actual) and str(expected) == str(actual):
+            return None
+        return f"erro: {actual}" if isinstance(actual, Exception) else f"a referência falhou ({expected})"
+    for i, ((expected_name, expected_table), (actual_name, actual_table)) in enumerate(zip(expected, actual)):
+        if expected_name != actual_name:
+            return f"plano {i + 1}: '{actual_name}' em vez de '{expected_name}'"
+        if expected_table != actual_table:
+            return f"tabela do plano '{expected_name}' diferente"
+    if len(expected) != len(actual):
+        return f"{len(actual)} planos em vez de {len(expected)}"
+    return None
+
+
+def compare_backends(pdf_paths, backends=None, prefilter=True, out=sys.stdout):
+    # Roda os extratores lado a lado sobre os mesmos PDFs, sem cache, e confere se os planos
+    # saem idênticos aos do primeiro (a referência). Devolve o número de PDFs com diferença.
+    backends = backends or list(BACKENDS)
+    reference = backends[0]
+    totals = dict.fromkeys(backends, 0.0)
+    differences = 0
+    for pdf_path in pdf_paths:
+        results = {}
+        seconds = {}
+        for name in backends:
+            started = time.perf_counter()
+            try:
+                results[name] = list(iter_plans(pdf_path, prefilter=prefilter, backend=name))
+            except Exception as e:
+                results[name] = e
+            seconds[name] = time.perf_counter() - started
+            totals[name] += seconds[name]
+
+        problems = []
+        for name in backends[1:]:
+            difference = _plans_difference(results[reference], results[name])
+            if difference:
+                problems.append(f"{name}: {difference}")
+        if problems:
+            differences += 1
+        timings = ", ".join(f"{name} {seconds[name]:.2f}s" + (f" ({seconds[reference] / seconds[name]:.1f}x)" if name != reference else "")
+                            for name in backends)
+        status = "DIFERENTE - " + "; ".join(problems) if problems else "planos idênticos"
+        print(f"{pdf_path}: {timings} - {status}", file=out)
+
+    timings = ", ".join(f"{name} {totals[name]:.2f}s" + (f" ({totals[reference] / totals[name]:.1f}x)" if name != reference and totals[name] else "")
+                        for name in backends)
+    print(f"\n{len(pdf_paths)} arquivos: {timings}; {differences} com diferença", file=out)
+    return differences
+
+
+def _extract_for_merge(pdf_path, debug=False, cache_dir=None, cache_max_bytes=None, prefilter=True, backend=DEFAULT_BACKEND):
+    # Roda num processo do pool; devolve (planos na ordem do PDF, páginas, segundos)
+    stats = {}
+    started = time.perf_counter()
+    cache = None
+    if cache_dir:
+        cache = ExtractionCache(cache_dir, DEFAULT_MAX_BYTES if cache_max_bytes is None else cache_max_bytes)
+    plans = list(iter_plans(pdf_path, debug, stats=stats, cache=cache, prefilter=prefilter, backend=backend))
+    return plans, stats.get('pages', 0), time.perf_counter() - started
+
+
+def iter_extracted(pdf_paths, workers=1, **options):
+    # (pdf, (planos, páginas, segundos) ou a exceção) na ordem de pdf_paths, cada um assim que
+    # ele e os anteriores terminam. No máximo 2 * workers PDFs são extraídos à frente do que
+    # está sendo gravado, então a memória não cresce com o número de PDFs.
+    if workers <= 1:
+        for pdf_path in pdf_paths:
+            try:
+                yield pdf_path, _extract_for_merge(pdf_path, **options)
+            except Exception as e:
+                yield pdf_path, e
+        return
+
+    log_level = logging.getLogger().getEffectiveLevel()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(log_level,)) as executor:
+        paths = iter(pdf_paths)
+        pending = deque((pdf_path, executor.submit(_extract_for_merge, pdf_path, **options))
+                        for pdf_path in itertools.islice(paths, 2 * workers))
+        while pending:
+            pdf_path, future = pending.popleft()
+            try:
+                result = future.result()
+            except Exception as e:
+                result = e
+            for next_path in itertools.islice(paths, 1):
+                pending.append((next_path, executor.submit(_extract_for_merge, next_path, **options)))
+            yield pdf_path, result
+
+
+def merge_sources(pdf_paths):
+    # Nome de cada PDF no --juntar (sufixo dos renomeados e coluna 'arquivo' das origens): o nome
+    # do arquivo, ou o caminho a partir da pasta comum quando dois PDFs têm o mesmo nome
+    names = [os.path.basename(pdf_path) for pdf_path in pdf_paths]
+    if len(set(names)) < len(names):
+        full_paths = [os.path.abspath(pdf_path) for pdf_path in pdf_paths]
+        root = os.path.commonpath([os.path.dirname(path) for path in full_paths])
+        names = [os.path.relpath(path, root).replace(os.sep, '/') for path in full_paths]
+    # O mesmo PDF passado duas vezes continua sendo duas origens
+    sources = []
+    seen = set()
+    for name in names:
+        source = name
+        stem, ext = os.path.splitext(name)
+        n = 2
+        while source in seen:
+            source = f"{stem} #{n}{ext}"
+            n += 1
+        seen.add(source)
+        sources.append(source)
+    return sources
+
+
+def _table_digest(table):
+    return hashlib.sha256(encode_plan('', table).encode('utf-8')).digest()
+
+
+class PlanMerger:
+    # Resolve os nomes repetidos entre PDFs depois das substituições. Guarda só o digest da
+    # tabela de cada nome, não as tabelas. origins recebe uma linha por plano (ver ORIGINS_COLUMNS).
+    def __init__(self, conflict='renomear', origins=None):
+        self.conflict = conflict
+        self.origins = origins if origins is not None else []
+        self.first = {}
+        self.identical = 0
+        self.renamed = 0
+        self.dropped = 0
+
+    def _rename(self, plan_name, source):
+        base_name = f"{plan_name} ({os.path.splitext(source)[0]})"
+        new_name = base_name
+        n = 2
+        while new_name in self.first:
+            new_name = f"{base_name} #{n}"
+            n += 1
+        return new_name
+
+    def merge(self, plans, source):
+        # plans: (nome original, nome depois das substituições, tabela) de um PDF
+        for original_name, plan_name, table in plans:
+            digest = _table_digest(table)
+            first = self.first.get(plan_name)
+            if first is None or first[1] == source:
+                # No mesmo PDF vale o comportamento de sempre (bloco repetido, ver write_unified_csv)
+                if first is None:
+                    self.first[plan_name] = (digest, source)
+                self.origins.append((plan_name, source, original_name, 'gravado'))
+                yield plan_name, table
+            elif first[0] == digest:
+                self.identical += 1
+                self.origins.append((plan_name, source, original_name, 'igual'))
+            elif self.conflict == 'falhar':
+                raise MergeConflictError(plan_name, first[1], source)
+            elif self.conflict == 'primeiro':
+                self.dropped += 1
+                self.origins.append((plan_name, source, original_name, 'descartado'))
+            else:
+                new_name = self._rename(plan_name, source)
+                self.first[new_name] = (digest, source)
+                self.renamed += 1
+                self.origins.append((new_name, source, original_name, 'renomeado'))
+                yield new_name, table
+
+
+def merge_files(pdf_paths, output_file, workers=1, plan_replacements=None, conflict='renomear', debug=False,
+                cache_dir=None, cache_max_bytes=None, prefilter=True, unmatched_rules='ignorar', brand_groups=None,
+                dedupe_plans=False, backend=DEFAULT_BACKEND, out=sys.stdout):
+    # Junta os planos de vários PDFs num CSV só, na ordem dos PDFs: a extração roda em paralelo e
+    # cada PDF é gravado assim que ele e os anteriores terminam. As substituições e a unificação
+    # de bandeiras valem sobre o conjunto todo; <saída>_origens.csv diz de que PDF veio cada plano.
+    # PDFs que falham ficam de fora (e são informados); conflitos seguem MERGE_CONFLICTS.
+    started = time.perf_counter()
+    pdf_paths = list(pdf_paths)
+    sources = merge_sources(pdf_paths)
+    rules = plan_replacements if isinstance(plan_replacements, ReplacementRules) else ReplacementRules(plan_replacements or {})
+    found_names = set()
+    origins_file = os.path.splitext(output_file)[0] + '_origens.csv'
+    merger = PlanMerger(conflict)
+    results = []
+    first_write = []
+
+    def merged_plans():
+        extracted = iter_extracted(pdf_paths, workers, debug=debug, cache_dir=cache_dir, cache_max_bytes=cache_max_bytes,
+                                   prefilter=prefilter, backend=backend)
+        for (pdf_path, result), source in zip(extracted, sources):
+            if isinstance(result, Exception):
+                logger.error(f"Erro ao converter '{pdf_path}': {str(result)}", exc_info=debug)
+                print(f"FALHA {pdf_path}: {result}", file=out)
+                results.append({'pdf': pdf_path, 'error': str(result), 'pages': 0, 'plans': 0})
+                continue
+            plans, pages, seconds = result
+            renamed = [(original_name, plan_name, table)
+                       for (original_name, _), (plan_name, table) in zip(plans, iter_replaced(plans, rules, found_names=found_names))]
+            if not first_write:
+                first_write.append(time.perf_counter() - started)
+            yield from merger.merge(renamed, source)
+            print(f"OK    {pdf_path} ({pages} páginas, {len(plans)} planos, {seconds:.2f}s)", file=out)
+            results.append({'pdf': pdf_path, 'error': None, 'pages': pages, 'plans': len(plans)})
+
+    tmp_file = f"{output_file}.{os.getpid()}.tmp"
+    tmp_origins = f"{origins_file}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_file, 'w', newline='', encoding='utf-8-sig') as f:
+            written = write_unified_csv(merged_plans(), f, brand_groups=brand_groups, dedupe=dedupe_plans)
+        if not written:
+            raise ValueError("Nenhum dado estruturado foi encontrado nos PDFs.")
+        if unmatched_rules == 'falhar':
+            missing = list(rules.unmatched(found_names))
+            if missing:
+                raise UnmatchedRulesError(missing)
+        with open(tmp_origins, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f, delimiter=';')
+            writer.writerow(ORIGINS_COLUMNS)
+            writer.writerows(merger.origins)
+        os.replace(tmp_file, output_file)
+        os.replace(tmp_origins, origins_file)
+    finally:
+        for path in (tmp_file, tmp_origins):
+            if os.path.exists(path):
+                os.remove(path)
+
+    elapsed = time.perf_counter() - started
+    failures = sum(1 for r in results if r['error'])
+    total_pages = sum(r['pages'] for r in results)
+    print(f"\n{len(results)} arquivos, {total_pages} páginas em {elapsed:.2f}s com {workers} processos, {failures} falhas "
+          f"-> {output_file} ({written} planos; primeiro PDF gravado após {first_write[0]:.2f}s)", file=out)
+    print(f"Nomes repetidos entre PDFs: {merger.identical} com tabela igual (gravados uma vez), {merger.renamed} renomeados, "
+          f"{merger.dropped} descartados; origens em {origins_file}", file=out)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Converte PDFs de taxas para CSV. Sem argumentos, abre a interface gráfica.")
+    parser.add_argument('entradas', nargs='*', help="Arquivos PDF, pastas ou padrões glob (ex.: 'taxas/*.pdf'); '-' lê um PDF da entrada padrão e escreve o CSV na saída padrão")
+    parser.add_argument('-o', '--saida', help="Pasta de saída (padrão: mesma pasta de cada PDF)")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1, help="Número de processos (padrão: número de CPUs)")
+    parser.add_argument('-p', '--paginas-workers', type=int, default=1, help="Processos por PDF para extrair páginas em paralelo (útil para poucos PDFs grandes)")
+    parser.add_argument('--config', default='config.ini', help="Arquivo de configuração com as regras de substituição")
+    parser.add_argument('--regras-nao-encontradas', choices=['ignorar', 'falhar'], default='ignorar',
+                        help="O que fazer quando uma regra exata não corresponde a nenhum plano do PDF (padrão: ignorar)")
+    parser.add_argument('--cache', default=DEFAULT_CACHE_DIR, help=f"Pasta do cache de extração (padrão: {DEFAULT_CACHE_DIR})")
+    parser.add_argument('--cache-max-mb', type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024), help="Tamanho máximo do cache de extração em MB")
+    parser.add_argument('--sem-cache', action='store_true', help="Não usa o cache de extração")
+    parser.add_argument('--unificar-planos-iguais', action='store_true',
+                        help="Grava uma vez só os planos com tabelas idênticas, com os nomes juntos no cabeçalho")
+    parser.add_argument('--sem-pre-filtro', action='store_true', help="Extrai todas as páginas, mesmo as que não têm tabela de taxas")
+    parser.add_argument('--extrator', choices=list(BACKENDS), default=DEFAULT_BACKEND,
+                        help=f"Fonte dos caracteres: pdfplumber ou pdfminer, que lê o layout direto e é mais rápido (padrão: {DEFAULT_BACKEND})")
+    parser.add_argument('--comparar-extratores', action='store_true',
+                        help="Extrai cada PDF com todos os extratores, confere se os planos são idênticos e mostra a velocidade relativa")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Reaproveita as páginas sem mudança da conversão anterior (<nome>_estado.z) e grava <nome>_delta.csv com os planos e taxas que mudaram")
+    parser.add_argument('--estado-anterior', metavar='ARQUIVO',
+                        help="Estado da conversão anterior a comparar, em vez do <nome>_estado.z da pasta de saída (implica --incremental, um PDF só)")
+    parser.add_argument('--juntar', metavar='ARQUIVO_CSV',
+                        help="Junta os planos de todos os PDFs num CSV só (e em <nome>_origens.csv, de que PDF veio cada plano)")
+    parser.add_argument('--conflito', choices=MERGE_CONFLICTS, default='renomear',
+                        help="Com --juntar, o que fazer com planos de mesmo nome e tabelas diferentes em PDFs diferentes (padrão: renomear, com o nome do PDF)")
+    parser.add_argument('--sqlite', metavar='BANCO', help="Grava também todas as taxas, em formato longo, na tabela 'taxas' deste banco SQLite")
+    parser.add_argument('--tabela-longa', choices=LONG_FORMATS, help="Grava também <nome>_taxas.<formato> com uma linha por taxa (parquet e feather precisam do pyarrow)")
+    parser.add_argument('--perfil', choices=['json', 'csv'], help="Grava os tempos por etapa e os contadores por página de cada PDF em <nome>_perfil.json/.csv")
+    parser.add_argument('--mostrar-config', action='store_true', help="Mostra as regras de substituição e os grupos de bandeiras do arquivo de configuração e sai")
+    parser.add_argument('--debug', action='store_true', help="Mostra mais informações no log")
+    args = parser.parse_args(argv)
+
+    if args.mostrar_config:
+        show_config(args.config)
+        return 0
+
+    if not args.entradas:
+        load_tk()
+        root = tk.Tk()
+        app = PDFtoCSVConverter(root)
+        root.mainloop()
+        return 0
+
+    init_worker(logging.INFO if args.debug else logging.WARNING)
+    if args.comparar_extratores:
+        pdf_paths = expand_inputs(args.entradas)
+        if not pdf_paths:
+            print("Nenhum arquivo PDF encontrado.", file=sys.stderr)
+            return 2
+        return 1 if compare_backends(pdf_paths, prefilter=not args.sem_pre_filtro) else 0
+
+    if args.entradas == ['-']:
+        # Modo filtro (ex.: curl ... | python taxas.py - > taxas.csv): nada é gravado fora do cache
+        try:
+            cache = None if args.sem_cache else ExtractionCache(args.cache, args.cache_max_mb * 1024 * 1024)
+            output = convert_to_buffer(sys.stdin.buffer, ReplacementRules(load_replacements(args.config)), debug=args.debug,
+                                       cache=cache, prefilter=not args.sem_pre_filtro,
+                                       unmatched_rules=args.regras_nao_encontradas,
+                                       brand_groups=load_brand_groups(args.config),
+                                       dedupe_plans=args.unificar_planos_iguais,
+                                       backend=args.extrator)
+        except Exception as e:
+            logger.error(f"Erro ao converter a entrada padrão: {str(e)}", exc_info=args.debug)
+            return 1
+        sys.stdout.buffer.write(output.getbuffer())
+        sys.stdout.buffer.flush()
+        return 0
+
+    pdf_paths = expand_inputs(args.entradas)
+    if not pdf_paths:
+        print("Nenhum arquivo PDF encontrado.", file=sys.stderr)
+        return 2
+    if args.juntar:
+        if args.incremental or args.estado_anterior or args.sqlite or args.tabela_longa or args.perfil:
+            print("--juntar não pode ser usado com --incremental, --estado-anterior, --sqlite, --tabela-longa ou --perfil.", file=sys.stderr)
+            return 2
+        output_dir = os.path.dirname(args.juntar)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        try:
+            results = merge_files(pdf_paths, args.juntar, max(1, min(args.workers, len(pdf_paths))),
+                                  ReplacementRules(load_replacements(args.config)), args.conflito, debug=args.debug,
+                                  cache_dir=None if args.sem_cache else args.cache,
+                                  cache_max_bytes=args.cache_max_mb * 1024 * 1024,
+                                  prefilter=not args.sem_pre_filtro,
+                                  unmatched_rules=args.regras_nao_encontradas,
+                                  brand_groups=load_brand_groups(args.config),
+                                  dedupe_plans=args.unificar_planos_iguais,
+                                  backend=args.extrator)
+        except Exception as e:
+            logger.error(f"Erro ao juntar os PDFs em '{args.juntar}': {str(e)}", exc_info=args.debug)
+            return 1
+        return 1 if any(r['error'] for r in results) else 0
+
+    # Na conversão incremental o cache de extração não é usado: as páginas vêm do estado anterior
+    incremental = args.incremental or bool(args.estado_anterior)
+    if args.estado_anterior and len(pdf_paths) > 1:
+        print("--estado-anterior só pode ser usado com um PDF.", file=sys.stderr)
+        return 2
+    if args.saida:
+        os.makedirs(args.saida, exist_ok=True)
+
+    results = run_batch(pdf_paths, max(1, args.workers), output_dir=args.saida,
+                        plan_replacements=ReplacementRules(load_replacements(args.config)), debug=args.debug,
+                        page_workers=args.paginas_workers,
+                        cache_dir=None if args.sem_cache or incremental else args.cache,
+                        cache_max_bytes=args.cache_max_mb * 1024 * 1024,
+                        prefilter=not args.sem_pre_filtro,
+                        profile_format=args.perfil,
+                        unmatched_rules=args.regras_nao_encontradas,
+                        brand_groups=load_brand_groups(args.config),
+                        dedupe_plans=args.unificar_planos_iguais,
+                        sqlite_path=args.sqlite,
+                        long_format=args.tabela_longa,
+                        backend=args.extrator,
+                        incremental=incremental,
+                        previous_state=args.estado_anterior)
+    return 1 if any(r['error'] for r in results) else 0
+
+
+# O tkinter só é importado quando a interface abre: a linha de comando e quem importa este
+# módulo não precisam do Tk nem de um display
+tk = filedialog = messagebox = ttk = None
+
+
+def load_tk():
+    global tk, filedialog, messagebox, ttk
+    import tkinter as tk
+    from tkinter import filedialog, messagebox, ttk
+
 
 class PDFtoCSVConverter:
     def __init__(self, root):
+        load_tk()
         self.root = root
         self.root.title("Conversor de Taxas PDF para CSV")
         self.root.geometry("700x650")
@@ -20,25 +1175,42 @@ class PDFtoCSVConverter:
         if self.logger.hasHandlers():
             self.logger.handlers.clear()
         
+        # A gravação do log em arquivo fica numa thread própria, fora da extração e do loop do Tk
         file_handler = logging.FileHandler('conversor_log.txt', encoding='utf-8')
-        log_format = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', '%Y-%m-%d %H:%M:%S')
-        file_handler.setFormatter(log_format)
-        self.logger.addHandler(file_handler)
+        self.stop_logging = start_queue_logging(self.logger, [file_handler])
         
         self.pdf_path = tk.StringVar()
         self.auto_save = tk.BooleanVar(value=True)
         self.csv_path = tk.StringVar()
         self.status = tk.StringVar(value="Pronto")
         self.debug_mode = tk.BooleanVar(value=True)
+        self.unmatched_policy = tk.StringVar(value='perguntar')
+        self.dedupe_plans = tk.BooleanVar(value=False)
+        self.export_format = tk.StringVar(value='nenhum')
         self.last_dir = tk.StringVar()
         
         self.find_text = tk.StringVar()
         self.replace_text = tk.StringVar()
+        self.rule_filter = tk.StringVar()
+        self.rule_count = tk.StringVar()
+        # plan_replacements espelha as regras do config_store em memória, para a conversão;
+        # a lista mostra só a janela visible_rules, a partir de rule_offset
         self.plan_replacements = {}
+        self.config_store = None
+        self.visible_rules = []
+        self.rule_offset = 0
+        self.rule_total = 0
+        self.extraction_cache = ExtractionCache()
         
-        self.create_widgets()
+        self.conversion_events = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.conversion_running = False
         
+        # Configuração primeiro (só arquivo, sem Tk); a árvore de widgets já nasce com os valores salvos
         self.load_config()
+        
+        self.create_widgets()
+        self.update_listbox()
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
 
     def create_widgets(self):
@@ -71,12 +1243,14 @@ class PDFtoCSVConverter:
         
         style.configure('TLabelframe', background=SECONDARY_COLOR, bordercolor='#444444')
         style.configure('TLabelframe.Label', foreground=PRIMARY_COLOR, background=SECONDARY_COLOR, font=("Segoe UI", 10, "bold"))
+
+        style.configure('Horizontal.TProgressbar', background=PRIMARY_COLOR, troughcolor='#333333', bordercolor=SECONDARY_COLOR, lightcolor=PRIMARY_COLOR, darkcolor=PRIMARY_COLOR)
         
         main_frame = ttk.Frame(self.root, padding="30 20")
         main_frame.pack(fill=tk.BOTH, expand=True)
         main_frame.grid_columnconfigure(0, weight=1)
         
-        main_frame.grid_rowconfigure(5, weight=1)
+        main_frame.grid_rowconfigure(6, weight=1)
 
         pdf_frame = ttk.LabelFrame(main_frame, text="Arquivo PDF", padding=10)
         pdf_frame.grid(row=0, column=0, columnspan=3, sticky="ew", pady=(0, 10))
@@ -90,10 +1264,16 @@ class PDFtoCSVConverter:
         output_frame.grid(row=1, column=0, columnspan=3, sticky="ew", pady=(0, 10))
         output_frame.grid_columnconfigure(0, weight=1)
         
-        self.csv_entry = ttk.Entry(output_frame, textvariable=self.csv_path, width=50, state='disabled')
+        output_state = 'disabled' if self.auto_save.get() else 'normal'
+        self.csv_entry = ttk.Entry(output_frame, textvariable=self.csv_path, width=50, state=output_state)
         self.csv_entry.grid(row=0, column=0, pady=5, sticky="ew")
-        self.csv_button = ttk.Button(output_frame, text="Procurar", command=self.select_output, state='disabled')
+        self.csv_button = ttk.Button(output_frame, text="Procurar", command=self.select_output, state=output_state)
         self.csv_button.grid(row=0, column=1, padx=(10, 0), pady=5)
+
+        export_frame = ttk.Frame(output_frame)
+        export_frame.grid(row=1, column=0, columnspan=2, pady=5, sticky="w")
+        ttk.Label(export_frame, text="Exportar também:").pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Combobox(export_frame, textvariable=self.export_format, values=EXPORT_CHOICES, state='readonly', width=10).pack(side=tk.LEFT)
         
         replace_frame = ttk.LabelFrame(main_frame, text="Alteração de nome de Plano", padding=10)
         replace_frame.grid(row=2, column=0, columnspan=3, sticky="ew", pady=(20, 0))
@@ -114,81 +1294,146 @@ class PDFtoCSVConverter:
         ttk.Button(button_frame, text="Adicionar Regra", command=self.add_replacement).pack(fill=tk.X, pady=2)
         ttk.Button(button_frame, text="Remover Selecionado", command=self.remove_replacement).pack(fill=tk.X, pady=2)
         
-        self.replacement_listbox = tk.Listbox(replace_frame, height=4, background='#2a2a2a', foreground=TERTIARY_COLOR, bd=0, relief='flat', highlightbackground=SECONDARY_COLOR, selectbackground=PRIMARY_COLOR, selectforeground='black')
-        self.replacement_listbox.grid(row=2, column=0, columnspan=3, sticky="ew", pady=(10, 0))
+        ttk.Label(replace_frame, text="Filtrar regras:").grid(row=2, column=0, padx=(0, 5), pady=(10, 0), sticky="w")
+        ttk.Entry(replace_frame, textvariable=self.rule_filter, width=40).grid(row=2, column=1, padx=(5, 0), pady=(10, 0), sticky="ew")
+        ttk.Label(replace_frame, textvariable=self.rule_count).grid(row=2, column=2, padx=(10, 0), pady=(10, 0), sticky="w")
+        self.rule_filter.trace_add('write', lambda *args: self.filter_rules())
+
+        # Lista virtual: o Listbox só tem as linhas visíveis e a barra de rolagem anda sobre o total de regras
+        list_frame = ttk.Frame(replace_frame)
+        list_frame.grid(row=3, column=0, columnspan=3, sticky="ew", pady=(5, 0))
+        list_frame.grid_columnconfigure(0, weight=1)
+        self.replacement_listbox = tk.Listbox(list_frame, height=RULES_VISIBLE, background='#2a2a2a', foreground=TERTIARY_COLOR, bd=0, relief='flat', highlightbackground=SECONDARY_COLOR, selectbackground=PRIMARY_COLOR, selectforeground='black')
+        self.replacement_listbox.grid(row=0, column=0, sticky="ew")
+        self.rule_scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.scroll_rules)
+        self.rule_scrollbar.grid(row=0, column=1, sticky="ns")
+        self.replacement_listbox.bind('<MouseWheel>', lambda e: self.scroll_rules('scroll', -1 if e.delta > 0 else 1, 'units'))
+        self.replacement_listbox.bind('<Button-4>', lambda e: self.scroll_rules('scroll', -1, 'units'))
+        self.replacement_listbox.bind('<Button-5>', lambda e: self.scroll_rules('scroll', 1, 'units'))
+        
+        options_frame = ttk.Frame(main_frame)
+        options_frame.grid(row=3, column=0, columnspan=3, pady=10, sticky="ew", padx=5)
+        ttk.Checkbutton(options_frame, text="Modo debug (mostrar mais informações)", variable=self.debug_mode).pack(side=tk.LEFT)
+        ttk.Checkbutton(options_frame, text="Unificar planos iguais", variable=self.dedupe_plans).pack(side=tk.LEFT, padx=(15, 0))
+        ttk.Combobox(options_frame, textvariable=self.unmatched_policy, values=UNMATCHED_POLICIES, state='readonly', width=10).pack(side=tk.RIGHT)
+        ttk.Label(options_frame, text="Regra não encontrada:").pack(side=tk.RIGHT, padx=(0, 5))
         
-        ttk.Checkbutton(main_frame, text="Modo debug (mostrar mais informações)", variable=self.debug_mode).grid(row=3, column=0, columnspan=3, pady=10, sticky="w", padx=5)
+        action_frame = ttk.Frame(main_frame)
+        action_frame.grid(row=4, column=0, columnspan=3, pady=25)
         
-        ttk.Button(main_frame, text="Converter para CSV", command=self.convert, style='Accent.TButton').grid(row=4, column=0, columnspan=3, pady=25)
+        self.convert_button = ttk.Button(action_frame, text="Converter para CSV", command=self.convert, style='Accent.TButton')
+        self.convert_button.pack(side=tk.LEFT, padx=5)
+        self.cancel_button = ttk.Button(action_frame, text="Cancelar", command=self.cancel_conversion, state='disabled')
+        self.cancel_button.pack(side=tk.LEFT, padx=5)
         
-        ttk.Label(main_frame, textvariable=self.status, font=("Segoe UI", 9, "italic")).grid(row=5, column=0, columnspan=3, sticky="w", pady=(10,0))
+        self.progress_bar = ttk.Progressbar(main_frame, orient=tk.HORIZONTAL, mode='determinate', maximum=1)
+        self.progress_bar.grid(row=5, column=0, columnspan=3, sticky="ew")
+        
+        ttk.Label(main_frame, textvariable=self.status, font=("Segoe UI", 9, "italic")).grid(row=6, column=0, columnspan=3, sticky="w", pady=(10,0))
     
     def add_replacement(self):
         find = self.find_text.get().strip()
         replace = self.replace_text.get().strip()
         if find and replace:
-            self.plan_replacements[find.lower()] = replace
+            # Curingas e expressões ficam com as maiúsculas (ver regras.py)
+            find = rule_key(find)
+            self.plan_replacements[find] = replace
+            self.config_store.add_rule(find, replace)
             self.update_listbox()
             self.find_text.set("")
             self.replace_text.set("")
-            self.save_config()
-            self.logger.info(f"Regra de substituição adicionada: '{find.lower()}' -> '{replace}'")
+            self.logger.info(f"Regra de substituição adicionada: '{find}' -> '{replace}'")
         else:
             self.logger.warning("Campos de substituição não podem estar vazios.")
 
     def remove_replacement(self):
         selected_indices = self.replacement_listbox.curselection()
-        if selected_indices:
-            index = selected_indices[0]
-            item_text = self.replacement_listbox.get(index)
-            find_text = item_text.split("' -> '")[0].replace("'", "").strip()
-            
+        if selected_indices and selected_indices[0] < len(self.visible_rules):
+            find_text = self.visible_rules[selected_indices[0]][0]
+
             if find_text in self.plan_replacements:
                 del self.plan_replacements[find_text]
+                self.config_store.remove_rule(find_text)
                 self.update_listbox()
-                self.save_config()
                 self.logger.info(f"Regra de substituição removida: '{find_text}'")
 
     def load_config(self):
-        config = configparser.ConfigParser()
-        if os.path.exists(self.config_file):
-            config.read(self.config_file, encoding='utf-8')
-            if 'SETTINGS' in config:
-                if 'last_dir' in config['SETTINGS']:
-                    self.last_dir.set(config['SETTINGS']['last_dir'])
-                if 'auto_save' in config['SETTINGS']:
-                    self.auto_save.set(config['SETTINGS'].getboolean('auto_save'))
-                if 'debug_mode' in config['SETTINGS']:
-                    self.debug_mode.set(config['SETTINGS'].getboolean('debug_mode'))
-                if 'csv_path' in config['SETTINGS']:
-                    self.csv_path.set(config['SETTINGS']['csv_path'])
-            
-            if 'REPLACEMENTS' in config:
-                self.plan_replacements = dict(config['REPLACEMENTS'])
-                self.update_listbox()
-        else:
+        # Regras e configurações vêm do config.db; na primeira vez ele é criado a partir do config.ini
+        if not os.path.exists(self.config_file) and not os.path.exists(store_path(self.config_file)):
             self.logger.warning("Arquivo de configuração não encontrado, usando configurações padrão.")
+        self.config_store = ConfigStore.for_config(self.config_file)
+        settings = self.config_store.settings()
+        booleans = configparser.ConfigParser.BOOLEAN_STATES
+        if 'last_dir' in settings:
+            self.last_dir.set(settings['last_dir'])
+        if settings.get('auto_save', '').lower() in booleans:
+            self.auto_save.set(booleans[settings['auto_save'].lower()])
+        if settings.get('debug_mode', '').lower() in booleans:
+            self.debug_mode.set(booleans[settings['debug_mode'].lower()])
+        if 'csv_path' in settings:
+            self.csv_path.set(settings['csv_path'])
+        if settings.get('export_format') in EXPORT_CHOICES:
+            self.export_format.set(settings['export_format'])
+        if settings.get('dedupe_plans', '').lower() in booleans:
+            self.dedupe_plans.set(booleans[settings['dedupe_plans'].lower()])
+        if settings.get('unmatched_rules') in UNMATCHED_POLICIES:
+            self.unmatched_policy.set(settings['unmatched_rules'])
+        self.plan_replacements = self.config_store.rules()
 
     def save_config(self):
-        config = configparser.ConfigParser()
-        config['SETTINGS'] = {
+        # Só as configurações que mudaram são gravadas; as regras já são gravadas uma a uma
+        # (ver configuracao.py) e as seções editadas à mão ficam no config.ini, intocadas
+        changed = self.config_store.save_settings({
             'last_dir': self.last_dir.get(),
             'auto_save': self.auto_save.get(),
             'debug_mode': self.debug_mode.get(),
-            'csv_path': self.csv_path.get()
-        }
-        config['REPLACEMENTS'] = self.plan_replacements
-        with open(self.config_file, 'w', encoding='utf-8') as configfile:
-            config.write(configfile)
+            'csv_path': self.csv_path.get(),
+            'unmatched_rules': self.unmatched_policy.get(),
+            'dedupe_plans': self.dedupe_plans.get(),
+            'export_format': self.export_format.get()
+        })
+        if changed:
             self.logger.info("Configurações salvas.")
 
     def update_listbox(self):
+        # Lê do banco só a janela visível das regras que passam no filtro
+        pattern = self.rule_filter.get().strip()
+        self.rule_total = self.config_store.count_rules(pattern)
+        self.rule_offset = max(0, min(self.rule_offset, self.rule_total - RULES_VISIBLE))
+        self.visible_rules = self.config_store.find_rules(pattern, RULES_VISIBLE, self.rule_offset)
         self.replacement_listbox.delete(0, tk.END)
-        for find, replace in self.plan_replacements.items():
+        for find, replace in self.visible_rules:
             self.replacement_listbox.insert(tk.END, f"'{find}' -> '{replace}'")
+        if self.rule_total:
+            self.rule_scrollbar.set(self.rule_offset / self.rule_total, (self.rule_offset + len(self.visible_rules)) / self.rule_total)
+        else:
+            self.rule_scrollbar.set(0, 1)
+        if pattern:
+            self.rule_count.set(f"{self.rule_total} de {len(self.plan_replacements)} regras")
+        else:
+            self.rule_count.set(f"{self.rule_total} regras")
+
+    def filter_rules(self):
+        self.rule_offset = 0
+        self.update_listbox()
+
+    def scroll_rules(self, action, amount, unit=None):
+        # Mesmos argumentos do command de um Scrollbar: ('moveto', fração) ou ('scroll', n, 'units'/'pages')
+        if action == 'moveto':
+            self.rule_offset = int(float(amount) * self.rule_total)
+        elif unit == 'pages':
+            self.rule_offset += int(amount) * RULES_VISIBLE
+        else:
+            self.rule_offset += int(amount)
+        self.update_listbox()
+        return 'break'
 
     def on_closing(self):
+        # A extração em andamento para na próxima página; a thread é daemon e não segura o fechamento
+        self.cancel_event.set()
         self.save_config()
+        self.config_store.close()
+        self.stop_logging()
         self.root.destroy()
         
     def select_pdf(self):
@@ -289,242 +1534,105 @@ class PDFtoCSVConverter:
         
         return result_container["selected_plan"]
     
-    def extract_data(self, pdf_path):
-        all_plans_data = {}
-        bandeira_map = ["VISA", "Master Card", "Elo", "Hipercard", "American Express", "Outros", "Markup", "PIX"]
-        
-        with pdfplumber.open(pdf_path) as pdf:
-            current_plan_name = None
-            data_rows = []
-            headers_with_boundaries = []
-
-            for page_num, page in enumerate(pdf.pages):
-                words = page.extract_words(x_tolerance=1, y_tolerance=3, keep_blank_chars=False)
-                if not words: continue
-
-                lines = {}
-                for word in words:
-                    y0 = round(word['top'] / 5.0) * 5.0  
-                    if y0 not in lines: lines[y0] = []
-                    lines[y0].append(word)
-
-                sorted_lines = sorted(lines.items())
-                
-                for y, line_words in sorted_lines:
-                    line_words.sort(key=lambda w: w['x0'])
-                    line_text = ' '.join(w['text'] for w in line_words)
-                    
-                    if "PAYTIME" in line_text.upper().replace("Ν", "N"):
-                        if current_plan_name and headers_with_boundaries and data_rows:
-                            header_texts = [h['text'] for h in headers_with_boundaries]
-                            all_plans_data[current_plan_name] = {'headers': header_texts, 'rows': data_rows}
-                        
-                        data_rows = []
-                        headers_with_boundaries = []
-                        
-                        match = re.search(r'^(.*?PAYTIME.*?)(Débito.*)$', line_text, re.IGNORECASE)
-                        if match:
-                            current_plan_name = match.group(1).strip()
-                            header_text_part = match.group(2)
-                            header_words = [w for w in line_words if header_text_part.find(w['text']) != -1]
-                        else:
-                            current_plan_name = line_text
-                            header_words = []
-
-                        if self.debug_mode.get(): self.logger.info(f"Plano encontrado: {current_plan_name}")
-                        
-                        if header_words:
-                            for i, word in enumerate(header_words):
-                                left = word['x0']
-                                right = header_words[i+1]['x0'] if i + 1 < len(header_words) else page.width
-                                headers_with_boundaries.append({'text': word['text'], 'left': left, 'right': right})
-                            if self.debug_mode.get(): self.logger.info(f"Taxas registradas")
-                        continue
-                    
-                    if headers_with_boundaries:
-                        bandeira_idx = len(data_rows)
-                        if bandeira_idx < len(bandeira_map):
-                            bandeira = bandeira_map[bandeira_idx]
-                            row_data = {'Bandeira': bandeira}
-                            
-                            for header_info in headers_with_boundaries:
-                                value_in_column = ""
-                                for word in line_words:
-                                    word_center = (word['x0'] + word['x1']) / 2
-                                    if header_info['left'] <= word_center < header_info['right']:
-                                        value_in_column += word['text'] + " "
-                                row_data[header_info['text']] = value_in_column.strip() if value_in_column else "-"
-                            
-                            if any(val not in ["", "-"] for key, val in row_data.items() if key != 'Bandeira'):
-                                data_rows.append(row_data)
-
-            if current_plan_name and headers_with_boundaries and data_rows:
-                header_texts = [h['text'] for h in headers_with_boundaries]
-                all_plans_data[current_plan_name] = {'headers': header_texts, 'rows': data_rows}
-
-        return all_plans_data
+    def extract_data(self, pdf_path, debug=False, progress=None):
+        # Roda fora da thread da interface: não pode tocar em widgets nem em variáveis do Tk
+        profile = RunProfile(source=pdf_path) if debug else None
+        all_plans = extract_data(pdf_path, debug=debug, logger=self.logger, cache=self.extraction_cache, progress=progress,
+                                 profile=profile)
+        if debug:
+            self.logger.info(f"Cache de extração: {self.extraction_cache.stats()}")
+            self.logger.info(f"Tempos por etapa: {profile.summary()}")
+        return all_plans
+
+    def _extract_in_background(self, pdf_path, debug):
+        def progress(pages_done, page_count):
+            if self.cancel_event.is_set():
+                raise ConversionCancelled()
+            self.conversion_events.put(('progress', pages_done, page_count))
 
-    def convert(self):
         try:
-            pdf_path = self.pdf_path.get()
-            if not pdf_path:
-                messagebox.showerror("Erro", "Por favor, selecione um arquivo PDF")
-                return
-            
-            output_dir = os.path.dirname(pdf_path) if self.auto_save.get() else self.csv_path.get()
-            if not output_dir:
-                messagebox.showerror("Erro", "Por favor, especifique uma pasta de saída")
-                return
-            
-            self.status.set("Processando...")
-            self.root.update()
-            
-            all_plans = self.extract_data(pdf_path)
-            
-            if not all_plans:
-                self.status.set("Nenhum dado encontrado")
-                self.logger.warning("Nenhum dado estruturado foi encontrado no PDF.")
-                messagebox.showwarning("Aviso", "Nenhum dado estruturado foi encontrado no PDF.")
+            self.conversion_events.put(('done', self.extract_data(pdf_path, debug, progress)))
+        except ConversionCancelled:
+            self.conversion_events.put(('cancelled',))
+        except Exception as e:
+            self.logger.error(f"Erro: {str(e)}", exc_info=True)
+            self.conversion_events.put(('error', e))
+
+    def cancel_conversion(self):
+        if self.conversion_running:
+            self.cancel_event.set()
+            self.cancel_button.config(state='disabled')
+            self.status.set("Cancelando...")
+
+    def convert(self):
+        if self.conversion_running:
+            return
+
+        pdf_path = self.pdf_path.get()
+        if not pdf_path:
+            messagebox.showerror("Erro", "Por favor, selecione um arquivo PDF")
+            return
+        
+        output_dir = os.path.dirname(pdf_path) if self.auto_save.get() else self.csv_path.get()
+        if not output_dir:
+            messagebox.showerror("Erro", "Por favor, especifique uma pasta de saída")
+            return
+        
+        self.status.set("Processando...")
+        self.progress_bar.config(value=0, maximum=1)
+        self.convert_button.config(state='disabled')
+        self.cancel_button.config(state='normal')
+        self.cancel_event.clear()
+        self.conversion_running = True
+        self.conversion_started = time.perf_counter()
+
+        worker = threading.Thread(target=self._extract_in_background, args=(pdf_path, self.debug_mode.get()), daemon=True)
+        worker.start()
+        self.root.after(100, self._poll_conversion, pdf_path, output_dir)
+
+    def _poll_conversion(self, pdf_path, output_dir):
+        # Consome os eventos da thread de extração na thread da interface; só o último
+        # progresso de cada rodada é exibido
+        last_progress = None
+        while True:
+            try:
+                event = self.conversion_events.get_nowait()
+            except queue.Empty:
+                break
+            if event[0] == 'progress':
+                last_progress = event
+            else:
+                self._finish_conversion(event, pdf_path, output_dir)
                 return
 
-            found_plans_names = list(all_plans.keys())
-            
-            for find_str, replace_str in list(self.plan_replacements.items()):
-                # Verifica se a regra de substituição já foi aplicada ou se o plano existe no PDF
-                if find_str.lower() not in [name.lower() for name in found_plans_names] and \
-                   replace_str.lower() not in [name.lower() for name in found_plans_names]:
-                    
-                    self.logger.warning(f"A regra '{find_str}' -> '{replace_str}' não foi encontrada. Solicitando ação do usuário.")
-                    
-                    selected_plan_to_replace = self.prompt_for_rule_application(find_str, replace_str, found_plans_names)
-                    
-                    if selected_plan_to_replace is None:
-                        # O usuário fechou a janela ou clicou em cancelar
-                        self.status.set("Conversão cancelada.")
-                        self.logger.info("Operação de conversão cancelada pelo usuário.")
-                        return
-                    
-                    if selected_plan_to_replace != "":
-                        # O usuário selecionou um novo plano.
-                        original_data = all_plans[selected_plan_to_replace]
-                        del all_plans[selected_plan_to_replace]
-                        all_plans[replace_str] = original_data
-                        
-                        # Remove a regra antiga e adiciona a nova, salvando no config.
-                        del self.plan_replacements[find_str] 
-                        self.plan_replacements[selected_plan_to_replace] = replace_str
-                        self.save_config()
-                        self.update_listbox()
-                        
-                        self.logger.info(f"Regra '{find_str}' -> '{replace_str}' aplicada a '{selected_plan_to_replace}'.")
-                        
-                        found_plans_names = list(all_plans.keys())
-                    else:
-                        # O usuário escolheu "Manter Original", não faz nada com a regra, apenas continua.
-                        self.logger.info(f"O nome original da regra '{find_str}' será mantido no resultado.")
-                        # A regra original é removida, pois não foi aplicada.
-                        del self.plan_replacements[find_str]
-                        self.save_config()
-                        self.update_listbox()
-                        
-            # O restante do código de conversão (que já tínhamos)
-            # ...
-            base_name = os.path.splitext(os.path.basename(pdf_path))[0]
-            csv_file = os.path.join(output_dir, f"{base_name}_unificado.csv")
-            
-            with open(csv_file, 'w', newline='', encoding='utf-8-sig') as f:
-                writer = csv.writer(f, delimiter=';', quoting=csv.QUOTE_ALL)
-                
-                for plan_name, data in all_plans.items():
-                    rows_data = data.get('rows', [])
-                    
-                    if not rows_data:
-                        self.logger.warning(f"Nenhum dado de linha encontrado para o plano '{plan_name}'. Ignorando.")
-                        continue
-                    
-                    consolidated_rows_data = []
-                    brand_names_to_keep = []
-                    
-                    brand_dict = {row['Bandeira']: row for row in rows_data}
-                    
-                    visa_data = brand_dict.get('VISA')
-                    master_data = brand_dict.get('Master Card')
-                    
-                    should_unify_visa_master = False
-                    if visa_data and master_data:
-                        visa_rates = [visa_data.get(h, '-') for h in data.get('headers', [])]
-                        master_rates = [master_data.get(h, '-') for h in data.get('headers', [])]
-                        if visa_rates == master_rates:
-                            should_unify_visa_master = True
-
-                    hipercard_data = brand_dict.get('Hipercard')
-                    amex_data = brand_dict.get('American Express')
-                    outros_data = brand_dict.get('Outros')
-
-                    should_unify_others = False
-                    if hipercard_data and amex_data and outros_data:
-                        others_match = True
-                        for h in data.get('headers', []):
-                            if h == 'Débito':
-                                continue
-                            if hipercard_data.get(h) != amex_data.get(h) or amex_data.get(h) != outros_data.get(h):
-                                others_match = False
-                                break
-                        if others_match:
-                            should_unify_others = True
-
-                    processed_brands = set()
-                    for row_dict in rows_data:
-                        brand = row_dict.get('Bandeira', '-')
-                        if brand in processed_brands:
-                            continue
-                        
-                        if should_unify_visa_master and brand in ['VISA', 'Master Card']:
-                            brand_names_to_keep.append('Visa/Master')
-                            new_row_dict = {'Bandeira': 'Visa/Master'}
-                            new_row_dict.update({h: visa_data.get(h, '-') for h in data.get('headers', [])})
-                            consolidated_rows_data.append(new_row_dict)
-                            processed_brands.add('VISA')
-                            processed_brands.add('Master Card')
-                        
-                        elif should_unify_others and brand in ['Hipercard', 'American Express', 'Outros']:
-                            brand_names_to_keep.append('Outros')
-                            new_row_dict = {'Bandeira': 'Outros'}
-                            for h in data.get('headers', []):
-                                if h == 'Débito':
-                                    new_row_dict[h] = outros_data.get(h, '-')
-                                else:
-                                    new_row_dict[h] = outros_data.get(h, '-')
-                            consolidated_rows_data.append(new_row_dict)
-                            processed_brands.add('Hipercard')
-                            processed_brands.add('American Express')
-                            processed_brands.add('Outros')
-                        
-                        else:
-                            brand_names_to_keep.append(brand)
-                            consolidated_rows_data.append(row_dict)
-                            processed_brands.add(brand)
-
-                    header_row = [plan_name] + brand_names_to_keep
-                    
-                    payment_options = data.get('headers', [])
-                    transposed_rows = []
-                    
-                    for option in payment_options:
-                        new_row = [option]
-                        for row_dict in consolidated_rows_data:
-                            value = row_dict.get(option, '-')
-                            new_row.append(value)
-                        transposed_rows.append(new_row)
-                    
-                    writer.writerow(header_row)
-                    writer.writerows(transposed_rows)
-                    writer.writerow([])
-                    writer.writerow([])
-
-            self.status.set("Conversão concluída!")
-            self.logger.info(f"Sucesso! Todos os planos foram salvos em: {csv_file}")
-            
+        if last_progress:
+            self._show_progress(last_progress[1], last_progress[2])
+        self.root.after(100, self._poll_conversion, pdf_path, output_dir)
+
+    def _show_progress(self, pages_done, page_count):
+        if self.cancel_event.is_set():
+            return
+        elapsed = time.perf_counter() - self.conversion_started
+        pages_per_s = pages_done / elapsed if elapsed else 0.0
+        eta = (page_count - pages_done) / pages_per_s if pages_per_s else 0.0
+        self.progress_bar.config(value=pages_done, maximum=page_count)
+        self.status.set(f"Processando... página {pages_done} de {page_count} ({pages_per_s:.1f} páginas/s, faltam ~{eta:.0f}s)")
+
+    def _finish_conversion(self, event, pdf_path, output_dir):
+        self.conversion_running = False
+        self.convert_button.config(state='normal')
+        self.cancel_button.config(state='disabled')
+        self.progress_bar.config(value=0)
+
+        try:
+            if event[0] == 'cancelled':
+                self.status.set("Conversão cancelada.")
+                self.logger.info("Operação de conversão cancelada pelo usuário.")
+            elif event[0] == 'error':
+                self.status.set("Erro durante a conversão")
+                messagebox.showerror("Erro", f"Ocorreu um erro:\n{str(event[1])}")
+            else:
+                self.save_output(event[1], pdf_path, output_dir)
         except Exception as e:
             self.status.set("Erro durante a conversão")
             self.logger.error(f"Erro: {str(e)}", exc_info=True)
@@ -533,7 +1641,83 @@ class PDFtoCSVConverter:
             if self.status.get() != "Conversão concluída!":
                 self.status.set("Pronto")
 
+    def save_output(self, all_plans, pdf_path, output_dir):
+        if not all_plans:
+            self.status.set("Nenhum dado encontrado")
+            self.logger.warning("Nenhum dado estruturado foi encontrado no PDF.")
+            messagebox.showwarning("Aviso", "Nenhum dado estruturado foi encontrado no PDF.")
+            return
+
+        # Índice em minúsculas montado uma vez e atualizado a cada plano renomeado
+        found_plans_names = {name.lower(): name for name, _ in all_plans}
+        rules = ReplacementRules(self.plan_replacements)
+        policy = self.unmatched_policy.get()
+
+        if policy == 'falhar':
+            missing = list(rules.unmatched(found_plans_names))
+            if missing:
+                raise UnmatchedRulesError(missing)
+
+        for find_str, replace_str in rules.unmatched(found_plans_names):
+            if find_str not in self.plan_replacements:
+                continue
+            if policy == 'ignorar':
+                self.logger.debug(f"A regra '{find_str}' -> '{replace_str}' não foi encontrada e foi ignorada.")
+                continue
+            if policy == 'manter':
+                # Só vale para esta conversão: as regras de outras tabelas continuam gravadas
+                self.logger.info(f"A regra '{find_str}' -> '{replace_str}' não foi encontrada; os nomes originais serão mantidos.")
+                continue
+
+            self.logger.warning(f"A regra '{find_str}' -> '{replace_str}' não foi encontrada. Solicitando ação do usuário.")
+            selected_plan_to_replace = self.prompt_for_rule_application(find_str, replace_str, list(dict.fromkeys(name for name, _ in all_plans)))
+
+            if selected_plan_to_replace is None:
+                # O usuário fechou a janela ou clicou em cancelar
+                self.status.set("Conversão cancelada.")
+                self.logger.info("Operação de conversão cancelada pelo usuário.")
+                return
+
+            if selected_plan_to_replace != "":
+                # O usuário selecionou um novo plano.
+                all_plans = [(replace_str if name == selected_plan_to_replace else name, data) for name, data in all_plans]
+
+                # Remove a regra antiga e adiciona a nova, salvando no config.
+                del self.plan_replacements[find_str]
+                self.plan_replacements[selected_plan_to_replace.lower()] = replace_str
+                self.config_store.replace_rule(find_str, selected_plan_to_replace.lower(), replace_str)
+                self.update_listbox()
+
+                self.logger.info(f"Regra '{find_str}' -> '{replace_str}' aplicada a '{selected_plan_to_replace}'.")
+
+                del found_plans_names[selected_plan_to_replace.lower()]
+                found_plans_names[replace_str.lower()] = replace_str
+            else:
+                # O usuário escolheu "Manter Original", não faz nada com a regra, apenas continua.
+                self.logger.info(f"O nome original da regra '{find_str}' será mantido no resultado.")
+                # A regra original é removida, pois não foi aplicada.
+                del self.plan_replacements[find_str]
+                self.config_store.remove_rule(find_str)
+                self.update_listbox()
+
+        all_plans = apply_replacements(all_plans, self.plan_replacements)
+        csv_file = unified_csv_path(pdf_path, output_dir)
+        write_unified_csv(all_plans, csv_file, logger=self.logger, brand_groups=load_brand_groups(self.config_file),
+                          dedupe=self.dedupe_plans.get())
+
+        export_format = self.export_format.get()
+        if export_format == 'sqlite':
+            exported = export_plans(all_plans, pdf_path, output_dir, sqlite_path=os.path.join(output_dir, SQLITE_FILE_NAME))
+        elif export_format in LONG_FORMATS:
+            exported = export_plans(all_plans, pdf_path, output_dir, long_format=export_format)
+        else:
+            exported = []
+        for path in exported:
+            self.logger.info(f"Taxas exportadas em: {path}")
+
+        self.status.set("Conversão concluída!")
+        self.logger.info(f"Sucesso! Todos os planos foram salvos em: {csv_file}")
+
+
 if __name__ == "__main__":
-    root = tk.Tk()
-    app = PDFtoCSVConverter(root)
-    root.mainloop()
+    sys.exit(main())
@@ -0,0 +1,65 @@
+import csv
+import io
+import logging
+import random
+
+import taxas
+from tabela import PlanTable
+
+HEADERS = ['Débito', 'Crédito', '2x', '3x']
+BRANDS = ['VISA', 'Master Card', 'Elo', 'Hipercard', 'American Express', 'Outros']
+
+
+def random_table(rnd):
+    table = PlanTable(HEADERS)
+    for brand in rnd.sample(BRANDS, rnd.randint(2, len(BRANDS))):
+        table.add_row(brand, [rnd.choice(['1,99%', '2,49%', '3,00%', '-']) for _ in HEADERS])
+    return table
+
+
+def random_plans(rnd, count):
+    # Poucas tabelas distintas e nomes repetidos, para que haja planos a unificar
+    tables = [random_table(rnd) for _ in range(max(1, count // 3))]
+    return [(f"Plano {rnd.randint(0, count)}", rnd.choice(tables)) for _ in range(count)]
+
+
+def read_blocks(text):
+    # (nome, bandeiras, linhas) de cada bloco; os blocos são separados por duas linhas vazias
+    blocks = []
+    rows = []
+    for row in csv.reader(io.StringIO(text), delimiter=';'):
+        if row:
+            rows.append(tuple(row))
+        elif rows:
+            blocks.append((rows[0][0], rows[0][1:], tuple(rows[1:])))
+            rows = []
+    return blocks
+
+
+def write(plans, dedupe):
+    output = io.StringIO()
+    written = taxas.write_unified_csv(plans, output, dedupe=dedupe)
+    return written, read_blocks(output.getvalue())
+
+
+def test_dedupe_matches_plain_output(caplog):
+    rnd = random.Random(3)
+    for _ in range(50):
+        plans = random_plans(rnd, rnd.randint(1, 30))
+        plain_written, plain = write(plans, dedupe=False)
+        caplog.clear()
+        with caplog.at_level(logging.INFO, logger=taxas.logger.name):
+            deduped_written, deduped = write(plans, dedupe=True)
+
+        # Desfazendo os apelidos, cada (nome, bloco) do CSV sem dedupe aparece no CSV com dedupe
+        expanded = {(name, brands, rows) for aliases, brands, rows in deduped for name in aliases.split(taxas.ALIAS_SEPARATOR)}
+        assert expanded == set(plain)
+        assert len({(brands, rows) for _, brands, rows in deduped}) == len(deduped)
+
+        assert plain_written == deduped_written == len(plans) == len(plain)
+        merged = len(plans) - len(deduped)
+        messages = [r.getMessage() for r in caplog.records if 'unificados' in r.getMessage()]
+        if merged:
+            assert messages == [f"{merged} planos com tabela idêntica a outro foram unificados ({len(deduped)} blocos no CSV)."]
+        else:
+            assert messages == []
@@ -0,0 +1,56 @@
+import logging
+
+import taxas
+from configuracao import ConfigStore
+from tabela import PlanTable
+
+
+class Var:
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+
+
+def make_converter(tmp_path, store, policy):
+    # Só o necessário para save_output, sem janela
+    converter = taxas.PDFtoCSVConverter.__new__(taxas.PDFtoCSVConverter)
+    converter.logger = logging.getLogger('teste')
+    converter.status = Var('Pronto')
+    converter.unmatched_policy = Var(policy)
+    converter.dedupe_plans = Var(False)
+    converter.export_format = Var('nenhum')
+    converter.config_file = str(tmp_path / 'config.ini')
+    converter.config_store = store
+    converter.plan_replacements = store.rules()
+    converter.update_listbox = lambda: None
+    return converter
+
+
+def plan(name):
+    table = PlanTable(['Débito', 'Crédito'])
+    table.add_row('VISA', ['1,00%', '2,00%'])
+    return name, table
+
+
+def test_keep_policy_does_not_touch_stored_rules(tmp_path):
+    store = ConfigStore(str(tmp_path / 'config.db'))
+    # Regras de outras tabelas (outros lojistas) que não aparecem neste PDF
+    store.add_rule('loja x plano a', 'Plano A')
+    store.add_rule('loja y plano b', 'Plano B')
+    store.add_rule('plano 1', 'Plano Um')
+    converter = make_converter(tmp_path, store, 'manter')
+
+    converter.save_output([plan('Plano 1'), plan('Plano 2')], str(tmp_path / 'loja_z.pdf'), str(tmp_path))
+
+    expected = {'loja x plano a': 'Plano A', 'loja y plano b': 'Plano B', 'plano 1': 'Plano Um'}
+    assert store.rules() == expected
+    assert converter.plan_replacements == expected
+    csv_text = (tmp_path / 'loja_z_unificado.csv').read_text(encoding='utf-8-sig')
+    assert '"Plano Um"' in csv_text and '"Plano 2"' in csv_text
+    assert converter.status.get() == "Conversão concluída!"
+    store.close()
@@ -0,0 +1,80 @@
+import fnmatch
+import random
+import re
+
+from configuracao import load_rules
+from regras import ReplacementRules, rule_kind
+
+
+def linear_lookup(plan_replacements, plan_name):
+    # Referência: a busca linear sobre as regras, na ordem do arquivo. Entre regras exatas que
+    # só diferem nas maiúsculas vale a última, como num dict.
+    key = plan_name.lower()
+    exact = {find.lower(): replace for find, replace in plan_replacements.items() if rule_kind(find) == 'exact'}
+    if key in exact:
+        return exact[key]
+    for find, replace in plan_replacements.items():
+        kind = rule_kind(find)
+        if kind == 'prefix':
+            matched = key.startswith(find[:-1].lower())
+        elif kind == 'wildcard':
+            matched = re.fullmatch(fnmatch.translate(find), key, re.IGNORECASE)
+        elif kind == 'regex':
+            matched = re.fullmatch(find[1:], key, re.IGNORECASE)
+        else:
+            continue
+        if matched:
+            return replace
+    return None
+
+
+def random_rule(rnd):
+    kind = rnd.choice(['exact', 'prefix', 'wildcard', 'regex'])
+    word = ''.join(rnd.choice('aAb1 ') for _ in range(rnd.randint(0, 3)))
+    if kind == 'exact':
+        return word.strip() or 'a'
+    if kind == 'prefix':
+        return word + '*'
+    if kind == 'wildcard':
+        return ''.join(rnd.choice('aB1 ?*') for _ in range(rnd.randint(1, 4)))
+    fragments = ['a', 'B', r'\d', r'\D', r'\S', r'\w+', '.', '(a|b)', 'a+', '[ab]', ' ', '.*']
+    return '~' + ''.join(rnd.choice(fragments) for _ in range(rnd.randint(1, 4)))
+
+
+def test_matches_linear_scan():
+    rnd = random.Random(1)
+    for _ in range(300):
+        plan_replacements = {}
+        for i in range(rnd.randint(1, 12)):
+            plan_replacements.setdefault(random_rule(rnd), f"R{i}")
+        rules = ReplacementRules(plan_replacements)
+        for _ in range(30):
+            name = ''.join(rnd.choice('abAB1 ') for _ in range(rnd.randint(0, 5)))
+            assert rules.lookup(name) == linear_lookup(plan_replacements, name), (plan_replacements, name)
+
+
+def test_catch_all_does_not_override_earlier_patterns():
+    rules = ReplacementRules({'~x(a|b)': 'G', 'x*': 'P', '~xa': 'R'})
+    assert rules.lookup('xa') == 'G'
+    assert rules.lookup('xc') == 'P'
+    assert ReplacementRules({'~plano \\d+x': 'Parcelado', '*': 'Outro'}).lookup('Plano 12x') == 'Parcelado'
+    assert ReplacementRules({'*': 'Outro', '~plano \\d+x': 'Parcelado'}).lookup('Plano 12x') == 'Outro'
+
+
+def test_exact_rule_wins():
+    rules = ReplacementRules({'*': 'Outro', 'Plano A': 'A'})
+    assert rules.lookup('plano a') == 'A'
+    assert rules.lookup('plano b') == 'Outro'
+
+
+def test_regex_keeps_case_of_escapes():
+    rules = ReplacementRules({'~plano \\D+x': 'Letras'})
+    assert rules.lookup('Plano abcx') == 'Letras'
+    assert rules.lookup('plano 12x') is None
+    assert ReplacementRules({'~plano \\S+\\Z': 'Fim'}).lookup('PLANO x1') == 'Fim'
+
+
+def test_load_rules_keeps_case_of_patterns(tmp_path):
+    config_file = tmp_path / 'config.ini'
+    config_file.write_text("[REPLACEMENTS]\nPlano A = A\n~plano \\D+x = Letras\nPlano B* = B\n", encoding='utf-8')
+    assert load_rules(str(config_file)) == {'plano a': 'A', '~plano \\D+x': 'Letras', 'plano b*': 'B'}
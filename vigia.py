@@ -0,0 +1,593 @@
+import argparse
+import configparser
+import io
+import logging
+import os
+import select
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import taxas
+from cache import file_digest, DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES
+from configuracao import config_version, load_settings
+from entrada import PdfSource
+from extratores import BACKENDS, DEFAULT_BACKEND
+from processos import LATENCY_WINDOW, init_warm_worker, load_config, percentile, worker_cache, worker_pid
+
+logger = logging.getLogger(__name__)
+
+# Modo vigia: converte os PDFs que chegam nas pastas de entrada (inotify no Linux, varredura
+# periódica nos outros sistemas), com o mesmo pool de processos aquecidos do servico.py
+DEFAULT_SETTLE = 1.0
+DEFAULT_INTERVAL = 2.0
+DEFAULT_MAX_QUEUE = 64
+# Sem o %%EOF no fim o PDF provavelmente ainda está sendo copiado; depois deste tempo parado
+# ele é convertido assim mesmo (PDFs com lixo depois do %%EOF)
+MAX_SETTLE = 30.0
+TICK = 0.25
+STATUS_EVERY = 10.0
+# Conteúdos já convertidos lembrados para copiar o CSV (os mais antigos são esquecidos)
+MAX_REMEMBERED = 4096
+
+# inotify(7)
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_Q_OVERFLOW = 0x4000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+INOTIFY_EVENT = struct.Struct('iIII')
+
+
+def is_pdf_name(name):
+    # Arquivos ocultos e temporários (.~lock, .part, cópias em andamento) ficam de fora
+    base = os.path.basename(name)
+    return base.lower().endswith('.pdf') and not base.startswith(('.', '~'))
+
+
+def list_pdfs(folder):
+    try:
+        with os.scandir(folder) as entries:
+            return [entry.path for entry in entries if is_pdf_name(entry.name) and entry.is_file()]
+    except OSError as e:
+        logger.warning(f"Não foi possível ler a pasta '{folder}': {str(e)}")
+        return []
+
+
+def looks_complete(path):
+    # Todo PDF termina com %%EOF (às vezes seguido de quebras de linha)
+    try:
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 1024))
+            return b'%%EOF' in f.read()
+    except OSError:
+        return False
+
+
+class PollingWatcher:
+    # Compara tamanho e mtime dos PDFs a cada intervalo
+    name = 'varredura'
+
+    def __init__(self, folders, interval=DEFAULT_INTERVAL):
+        self.folders = folders
+        self.interval = interval
+        self.snapshot = {}
+        self.next_scan = 0.0
+
+    def scan(self):
+        snapshot = {}
+        changed = []
+        for folder in self.folders:
+            for path in list_pdfs(folder):
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                snapshot[path] = (st.st_size, st.st_mtime_ns)
+                if self.snapshot.get(path) != snapshot[path]:
+                    changed.append(path)
+        self.snapshot = snapshot
+        self.next_scan = time.monotonic() + self.interval
+        return changed
+
+    def poll(self, timeout):
+        wait = self.next_scan - time.monotonic()
+        if wait > timeout:
+            time.sleep(timeout)
+            return []
+        if wait > 0:
+            time.sleep(wait)
+        return self.scan()
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    # Eventos do kernel por pasta, lidos via ctypes (sem dependências extras). Na fila de eventos
+    # estourada (centenas de arquivos de uma vez) as pastas são varridas de novo.
+    name = 'inotify'
+    MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+    def __init__(self, folders):
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 falhou")
+        self.folders = {}
+        for folder in folders:
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(folder), self.MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                os.close(self.fd)
+                raise OSError(error, f"inotify_add_watch falhou para '{folder}'")
+            self.folders[wd] = folder
+
+    def scan(self):
+        return [path for folder in self.folders.values() for path in list_pdfs(folder)]
+
+    def poll(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        data = b''
+        while True:
+            try:
+                data += os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+        paths = []
+        offset = 0
+        while offset + INOTIFY_EVENT.size <= len(data):
+            wd, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            name = data[offset + INOTIFY_EVENT.size:offset + INOTIFY_EVENT.size + length].rstrip(b'\0')
+            offset += INOTIFY_EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                logger.warning("Fila do inotify cheia, varrendo as pastas de novo")
+                paths.extend(self.scan())
+                continue
+            folder = self.folders.get(wd)
+            if folder is not None and name and is_pdf_name(os.fsdecode(name)):
+                paths.append(os.path.join(folder, os.fsdecode(name)))
+        return paths
+
+    def close(self):
+        os.close(self.fd)
+
+
+def make_watcher(folders, interval=DEFAULT_INTERVAL, polling=False):
+    if not polling and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(folders)
+        except OSError as e:
+            logger.warning(f"inotify indisponível ({str(e)}), usando varredura a cada {interval:g}s")
+    return PollingWatcher(folders, interval)
+
+
+def write_atomic(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def copy_atomic(source, path):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def convert_watched(pdf_path, csv_file, config_file, options):
+    # Roda num processo do pool (ver processos.py); devolve (páginas, segundos).
+    # O CSV só aparece na pasta de saída completo.
+    rules, brand_groups = load_config(config_file)
+    stats = {}
+    started = time.perf_counter()
+    output = taxas.convert_to_buffer(PdfSource(pdf_path), rules, cache=worker_cache(),
+                                     brand_groups=brand_groups, stats=stats, **options)
+    write_atomic(csv_file, output.getbuffer())
+    return stats.get('pages', 0), time.perf_counter() - started
+
+
+class FolderWatcher:
+    # pending: PDFs vistos e ainda não estáveis, na ordem de chegada -> {'size', 'mtime', 'since', 'detected'}
+    # running: conversões enviadas ao pool, no máximo workers + max_queue; o resto espera em pending.
+    # done: (sha256, versão do config.ini/config.db) -> (CSV já gerado, tamanho, mtime), para copiar em vez de
+    # converter de novo; no máximo MAX_REMEMBERED, em ordem de uso. Se o CSV foi apagado ou mudou, converte de novo.
+    def __init__(self, folders, output_dir=None, workers=None, config_file='config.ini', options=None,
+                 settle=DEFAULT_SETTLE, interval=DEFAULT_INTERVAL, max_queue=DEFAULT_MAX_QUEUE, polling=False,
+                 cache_dir=DEFAULT_CACHE_DIR, cache_max_bytes=DEFAULT_MAX_BYTES, log_level=logging.WARNING,
+                 out=sys.stdout):
+        self.folders = folders
+        self.output_dir = output_dir
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.config_file = config_file
+        self.options = options or {}
+        self.settle = settle
+        self.max_queue = max_queue
+        self.out = out
+        self.watcher = make_watcher(folders, interval, polling)
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=init_warm_worker,
+                                            initargs=(log_level, cache_dir, cache_max_bytes))
+        self.pending = {}
+        self.running = {}
+        self.waiting = {}
+        self.done = OrderedDict()
+        self.stop_event = threading.Event()
+        self.converted = 0
+        self.copied = 0
+        self.unchanged = 0
+        self.failed = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.last_status = time.monotonic()
+
+    def csv_path(self, pdf_path):
+        return taxas.unified_csv_path(pdf_path, self.output_dir)
+
+    def notice(self, path, now, initial=False):
+        try:
+            st = os.stat(path)
+        except OSError:
+            self.pending.pop(path, None)
+            return
+        if initial:
+            # PDFs que já estavam na pasta e têm CSV mais novo foram convertidos numa execução anterior
+            try:
+                if os.path.getmtime(self.csv_path(path)) >= st.st_mtime:
+                    return
+            except OSError:
+                pass
+        entry = self.pending.get(path)
+        if entry is None:
+            self.pending[path] = {'size': st.st_size, 'mtime': st.st_mtime_ns, 'since': now, 'detected': now}
+        elif (entry['size'], entry['mtime']) != (st.st_size, st.st_mtime_ns):
+            entry.update(size=st.st_size, mtime=st.st_mtime_ns, since=now)
+
+    def check_pending(self, now):
+        busy_paths = {job['path'] for job in self.running.values()}
+        busy_paths.update(job['path'] for jobs in self.waiting.values() for job in jobs)
+        for path, entry in list(self.pending.items()):
+            if len(self.running) >= self.workers + self.max_queue:
+                break
+            if path in busy_paths:
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                del self.pending[path]
+                continue
+            if (entry['size'], entry['mtime']) != (st.st_size, st.st_mtime_ns):
+                entry.update(size=st.st_size, mtime=st.st_mtime_ns, since=now)
+                continue
+            quiet = now - entry['since']
+            if st.st_size == 0:
+                if quiet >= MAX_SETTLE:
+                    # Vazio há muito tempo: não é uma cópia em andamento. Volta para a fila se for gravado de novo.
+                    del self.pending[path]
+                    self.failed += 1
+                    print(f"FALHA {path}: arquivo vazio", file=self.out)
+                continue
+            if quiet < self.settle:
+                continue
+            if quiet < MAX_SETTLE and not looks_complete(path):
+                continue
+            del self.pending[path]
+            self.dispatch(path, entry, now)
+
+    def dispatch(self, path, entry, now):
+        try:
+            digest = file_digest(path)
+        except OSError as e:
+            logger.warning(f"Não foi possível ler '{path}': {str(e)}")
+            return
+        key = (digest, config_version(self.config_file))
+        job = {'path': path, 'csv': self.csv_path(path), 'key': key, 'detected': entry['detected']}
+        previous_csv = self.remembered_csv(key)
+        if previous_csv is not None:
+            self.reuse(job, previous_csv, now)
+            return
+        if any(running['key'] == key for running in self.running.values()):
+            # Mesmo conteúdo já em conversão: espera o resultado e copia
+            self.waiting.setdefault(key, []).append(job)
+            return
+        self.submit(job)
+
+    def submit(self, job):
+        future = self.executor.submit(convert_watched, job['path'], job['csv'], self.config_file, self.options)
+        self.running[future] = job
+
+    def remember(self, key, csv_file):
+        try:
+            st = os.stat(csv_file)
+        except OSError:
+            return
+        self.done[key] = (csv_file, st.st_size, st.st_mtime_ns)
+        self.done.move_to_end(key)
+        while len(self.done) > MAX_REMEMBERED:
+            self.done.popitem(last=False)
+
+    def remembered_csv(self, key):
+        entry = self.done.get(key)
+        if entry is None:
+            return None
+        csv_file, size, mtime = entry
+        try:
+            st = os.stat(csv_file)
+        except OSError:
+            st = None
+        if st is None or (st.st_size, st.st_mtime_ns) != (size, mtime):
+            del self.done[key]
+            logger.info(f"'{csv_file}' foi apagado ou alterado depois da conversão; convertendo de novo")
+            return None
+        self.done.move_to_end(key)
+        return csv_file
+
+    def reuse(self, job, previous_csv, now):
+        if os.path.abspath(previous_csv) == os.path.abspath(job['csv']):
+            # Mesmo arquivo salvo de novo sem mudar o conteúdo
+            self.unchanged += 1
+            logger.info(f"Sem mudança: {job['path']}")
+            return
+        try:
+            copy_atomic(previous_csv, job['csv'])
+        except OSError as e:
+            # Ex.: o CSV anterior sumiu entre a verificação e a cópia
+            logger.warning(f"Não foi possível copiar '{previous_csv}' ({str(e)}); convertendo '{job['path']}'")
+            self.done.pop(job['key'], None)
+            self.submit(job)
+            return
+        self.copied += 1
+        self.remember(job['key'], job['csv'])
+        self.latencies.append(now - job['detected'])
+        print(f"OK    {job['path']} -> {job['csv']} (conteúdo igual a {previous_csv}, copiado)", file=self.out)
+
+    def collect(self, now):
+        for future in [f for f in self.running if f.done()]:
+            job = self.running.pop(future)
+            followers = self.waiting.pop(job['key'], [])
+            try:
+                pages, seconds = future.result()
+            except Exception as e:
+                self.failed += 1 + len(followers)
+                logger.error(f"Erro ao converter '{job['path']}': {str(e)}")
+                print(f"FALHA {job['path']}: {str(e)}", file=self.out)
+                for follower in followers:
+                    print(f"FALHA {follower['path']}: {str(e)}", file=self.out)
+                continue
+            self.converted += 1
+            self.remember(job['key'], job['csv'])
+            latency = now - job['detected']
+            self.latencies.append(latency)
+            print(f"OK    {job['path']} -> {job['csv']} ({pages} páginas, {seconds:.2f}s, {latency:.2f}s desde a chegada)",
+                  file=self.out)
+            for follower in followers:
+                self.reuse(follower, job['csv'], now)
+
+    def report_status(self, now):
+        if now - self.last_status < STATUS_EVERY:
+            return
+        self.last_status = now
+        if self.pending or self.running:
+            logger.info(f"{len(self.pending)} PDFs esperando, {len(self.running)} em conversão, {self.converted} convertidos")
+
+    def status(self):
+        latencies = sorted(self.latencies)
+        return {
+            'convertidos': self.converted,
+            'copiados': self.copied,
+            'sem_mudanca': self.unchanged,
+            'falhas': self.failed,
+            'esperando': len(self.pending),
+            'em_conversao': len(self.running),
+            'latencia_s': {name: None if value is None else round(value, 2) for name, value in [
+                ('p50', percentile(latencies, 50)),
+                ('p90', percentile(latencies, 90)),
+                ('p99', percentile(latencies, 99)),
+                ('max', latencies[-1] if latencies else None),
+            ]},
+        }
+
+    def warm_up(self):
+        pids = {future.result() for future in [self.executor.submit(worker_pid) for _ in range(self.workers)]}
+        logger.info(f"{len(pids)} processos prontos")
+
+    def run(self, once=False):
+        # once: converte o que já está nas pastas (e o que chegar enquanto isso) e sai quando tudo terminou
+        now = time.monotonic()
+        for path in self.watcher.scan():
+            self.notice(path, now, initial=True)
+        logger.info(f"Vigiando {', '.join(self.folders)} ({self.watcher.name}), saída em {self.output_dir or 'mesma pasta de cada PDF'}")
+        while not self.stop_event.is_set():
+            timeout = TICK if self.pending or self.running else 1.0
+            paths = self.watcher.poll(timeout)
+            now = time.monotonic()
+            for path in paths:
+                self.notice(path, now)
+            self.collect(now)
+            self.check_pending(now)
+            self.report_status(now)
+            if once and not self.pending and not self.running:
+                break
+
+    def stop(self):
+        self.stop_event.set()
+
+    def close(self):
+        self.watcher.close()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+def load_watch_settings(config_file):
+    # [VIGIA] pastas = pasta1, pasta2 / saida = pasta; sem elas vale o que a interface lembra:
+    # a última pasta aberta (last_dir) e a pasta de saída quando não salva ao lado do PDF (csv_path)
+    config = configparser.ConfigParser()
+    if os.path.exists(config_file):
+        config.read(config_file, encoding='utf-8')
+    watch = config['VIGIA'] if 'VIGIA' in config else {}
+    settings = load_settings(config_file)
+    folders = [f.strip() for f in watch.get('pastas', '').split(',') if f.strip()]
+    if not folders and settings.get('last_dir'):
+        folders = [settings['last_dir']]
+    output_dir = watch.get('saida', '').strip() or None
+    if output_dir is None and settings.get('csv_path') and settings.get('auto_save', 'True') == 'False':
+        output_dir = settings['csv_path']
+    options = {
+        'dedupe_plans': settings.get('dedupe_plans', 'False') == 'True',
+        'unmatched_rules': 'falhar' if settings.get('unmatched_rules') == 'falhar' else 'ignorar',
+    }
+    return folders, output_dir, options
+
+
+def watch(args):
+    taxas.init_worker(logging.INFO)
+    folders, output_dir, options = load_watch_settings(args.config)
+    folders = args.pasta or folders
+    output_dir = args.saida or output_dir
+    if not folders:
+        print("Nenhuma pasta para vigiar: use --pasta ou 'pastas' na seção [VIGIA] do arquivo de configuração.", file=sys.stderr)
+        return 2
+    missing = [folder for folder in folders if not os.path.isdir(folder)]
+    if missing:
+        print(f"Pasta não encontrada: {', '.join(missing)}", file=sys.stderr)
+        return 2
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    options['backend'] = args.extrator
+
+    watcher = FolderWatcher(folders, output_dir, args.workers, args.config, options, args.estabilidade, args.intervalo,
+                            args.fila_max, args.varredura, None if args.sem_cache else args.cache,
+                            args.cache_max_mb * 1024 * 1024, logging.INFO if args.debug else logging.WARNING)
+    try:
+        watcher.warm_up()
+        watcher.run(once=args.uma_vez)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+    status = watcher.status()
+    latency = status['latencia_s']
+    summary = (f"\n{status['convertidos']} convertidos, {status['copiados']} copiados (conteúdo repetido), "
+               f"{status['sem_mudanca']} sem mudança, {status['falhas']} falhas")
+    if latency['p50'] is not None:
+        summary += f"; latência p50 {latency['p50']}s, p90 {latency['p90']}s, p99 {latency['p99']}s"
+    print(summary)
+    return 1 if status['falhas'] else 0
+
+
+def _drop_file(path, data, pieces, pause):
+    # Grava o PDF em pedaços, como uma cópia lenta pela rede
+    step = max(1, len(data) // pieces)
+    with open(path, 'wb') as f:
+        for offset in range(0, len(data), step):
+            f.write(data[offset:offset + step])
+            f.flush()
+            time.sleep(pause)
+
+
+def self_test(args):
+    # Sobe o vigia numa pasta temporária, solta PDFs sintéticos (gravados aos poucos, alguns
+    # repetidos) todos de uma vez e confere cada CSV com a conversão local dos mesmos bytes
+    from concurrent.futures import ThreadPoolExecutor
+    from sintetico import generate_rate_sheet
+    taxas.init_worker(logging.INFO if args.debug else logging.WARNING)
+    rules = taxas.ReplacementRules(taxas.load_replacements(args.config))
+    brand_groups = taxas.load_brand_groups(args.config)
+    distinct = max(1, args.arquivos // 2)
+    pdfs = [generate_rate_sheet(None, plans=args.planos, columns=8, brands=6, noise_pages=1, seed=i)
+            for i in range(distinct)]
+    expected = [taxas.convert_to_buffer(pdf, rules, brand_groups=brand_groups).getvalue() for pdf in pdfs]
+
+    with tempfile.TemporaryDirectory() as workdir:
+        inbox = os.path.join(workdir, 'entrada')
+        outbox = os.path.join(workdir, 'saida')
+        os.makedirs(inbox)
+        os.makedirs(outbox)
+        watcher = FolderWatcher([inbox], outbox, args.workers, args.config, {}, args.estabilidade, args.intervalo,
+                                args.fila_max, args.varredura, None, DEFAULT_MAX_BYTES, out=io.StringIO())
+        watcher.warm_up()
+        thread = threading.Thread(target=watcher.run, daemon=True)
+        thread.start()
+        try:
+            started = time.perf_counter()
+            names = [f"taxas_{i:04d}.pdf" for i in range(args.arquivos)]
+            with ThreadPoolExecutor(max_workers=16) as pool:
+                list(pool.map(lambda item: _drop_file(os.path.join(inbox, item[1]), pdfs[item[0] % distinct], 4, 0.05),
+                              enumerate(names)))
+            csv_files = [taxas.unified_csv_path(os.path.join(inbox, name), outbox) for name in names]
+            deadline = time.monotonic() + args.timeout
+            while time.monotonic() < deadline and sum(1 for f in csv_files if os.path.exists(f)) < len(csv_files):
+                time.sleep(0.1)
+            elapsed = time.perf_counter() - started
+        finally:
+            watcher.stop()
+            thread.join()
+            watcher.close()
+
+        missing = 0
+        mismatches = 0
+        for i, csv_file in enumerate(csv_files):
+            if not os.path.exists(csv_file):
+                missing += 1
+                continue
+            with open(csv_file, 'rb') as f:
+                if f.read() != expected[i % distinct]:
+                    mismatches += 1
+        leftovers = [name for name in os.listdir(outbox) if name.endswith('.tmp')]
+
+    status = watcher.status()
+    print(f"{len(names)} PDFs ({distinct} distintos) em {elapsed:.2f}s com {watcher.workers} processos ({watcher.watcher.name}): "
+          f"{status['convertidos']} convertidos, {status['copiados']} copiados, {missing} sem CSV, "
+          f"{mismatches} diferentes da conversão local, {len(leftovers)} temporários; "
+          f"latência p50 {status['latencia_s']['p50']}s, p99 {status['latencia_s']['p99']}s")
+    return 1 if missing or mismatches or leftovers or status['convertidos'] != distinct else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Vigia pastas e converte para CSV os PDFs de taxas que chegam nelas.")
+    parser.add_argument('--pasta', action='append', help="Pasta a vigiar (pode repetir; padrão: 'pastas' em [VIGIA] ou a última pasta usada na interface)")
+    parser.add_argument('-o', '--saida', help="Pasta de saída (padrão: 'saida' em [VIGIA], a pasta de saída da interface ou a pasta de cada PDF)")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1, help="Processos de conversão (padrão: número de CPUs)")
+    parser.add_argument('--config', default='config.ini', help="Arquivo de configuração com as regras de substituição")
+    parser.add_argument('--fila-max', type=int, default=DEFAULT_MAX_QUEUE, help="Conversões enviadas ao pool além das em andamento; o resto espera na pasta")
+    parser.add_argument('--estabilidade', type=float, default=DEFAULT_SETTLE, help="Segundos sem mudar de tamanho antes de converter um PDF")
+    parser.add_argument('--intervalo', type=float, default=DEFAULT_INTERVAL, help="Segundos entre varreduras quando o inotify não está disponível")
+    parser.add_argument('--varredura', action='store_true', help="Usa varredura periódica mesmo com inotify disponível")
+    parser.add_argument('--extrator', choices=list(BACKENDS), default=DEFAULT_BACKEND, help=f"Fonte dos caracteres (padrão: {DEFAULT_BACKEND})")
+    parser.add_argument('--uma-vez', action='store_true', help="Converte os PDFs que já estão nas pastas e sai")
+    parser.add_argument('--cache', default=DEFAULT_CACHE_DIR, help=f"Pasta do cache de extração (padrão: {DEFAULT_CACHE_DIR})")
+    parser.add_argument('--cache-max-mb', type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024), help="Tamanho máximo do cache de extração em MB")
+    parser.add_argument('--sem-cache', action='store_true', help="Não usa o cache de extração")
+    parser.add_argument('--debug', action='store_true', help="Mostra mais informações no log")
+    sub = parser.add_subparsers(dest='comando')
+
+    p = sub.add_parser('testar', help="Vigia uma pasta temporária, solta PDFs sintéticos de uma vez e confere os CSVs")
+    p.add_argument('--arquivos', type=int, default=200)
+    p.add_argument('--planos', type=int, default=5)
+    p.add_argument('--timeout', type=float, default=300.0)
+
+    args = parser.parse_args(argv)
+    if args.comando == 'testar':
+        return self_test(args)
+    return watch(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())